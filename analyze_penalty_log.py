@@ -1,33 +1,108 @@
-import re
+class PenaltyStats(object):
+    """
+    Statistics of a penalty log, updated one event at a time, in constant
+    memory. Events are tuples:
+    - ('trial', number): a new trial starts
+    - ('destination',): the agent reached its destination
+    - ('penalty', state, n_visits, action, reward): the agent was
+      penalized, state being (light, oncoming, left, waypoint)
+    parse_penalty_log turns a printed log into these events; an agent can
+    also send them directly (see agent.LearningAgent).
+    """
+
+    def __init__(self, early_trials=50):
+        self.early_trials = early_trials
+        self.n_trials = 0
+        self.dest_reached = 0  # trials in which the destination was reached
+        self.last_unreached = None
+        self.penalties = 0
+        self.early_penalties = 0  # penalties during the first early_trials trials
+        self.penalties_no_traffic = 0  # penalties with no oncoming traffic nor traffic to the left
+        self.last_no_traffic = None
+        self.reached = None  # whether the current trial reached its destination
+
+    def __call__(self, event):
+        if event[0] == 'trial':
+            self.end_trial()
+            self.n_trials += 1
+            self.reached = False
+        elif self.n_trials == 0:
+            return  # nothing counts before the first trial
+        elif event[0] == 'destination':
+            self.reached = True
+        elif event[0] == 'penalty':
+            trial = self.n_trials - 1
+            self.penalties += 1
+            if trial < self.early_trials:
+                self.early_penalties += 1
+            light, oncoming, left, waypoint = event[1]
+            if oncoming is None and left is None:
+                self.penalties_no_traffic += 1
+                self.last_no_traffic = trial
+
+    def end_trial(self):
+        if self.reached is None:
+            return
+        if self.reached:
+            self.dest_reached += 1
+        else:
+            self.last_unreached = self.n_trials - 1
+        self.reached = None
+
+    def report(self):
+        self.end_trial()
+        print "number of destinations reached: ", self.dest_reached
+        if self.last_unreached is not None:
+            print "last unreached destination: trial", self.last_unreached
+        print "total number of penalties: ", self.penalties
+        print "penalties during first {} trials:".format(self.early_trials), self.early_penalties
+        print "total number of penalties on clear intersections:", self.penalties_no_traffic
+        if self.last_no_traffic is not None:
+            print "last penalty on clear intersection:", self.last_no_traffic
+
+
+def parse_value(text):
+    return None if text == 'None' else text
+
+
+def parse_penalty_log(lines):
+    """Yield the events (see PenaltyStats) of a printed penalty log, line by line."""
+    penalty = None
+    for line in lines:
+        line = line.strip()
+        if line.startswith('Simulator.run(): Trial'):
+            yield ('trial', int(line.rsplit(' ', 1)[1]))
+        elif line.endswith('reached destination!'):
+            yield ('destination',)
+        elif line == 'penalty!':
+            penalty = {}
+        elif penalty is None:
+            continue
+        elif line.startswith('light:'):
+            # light: green, oncoming: None, left: None, waypoint: right
+            penalty['state'] = tuple(parse_value(item.split(': ', 1)[1]) for item in line.split(', '))
+        elif line.startswith('visit number'):
+            penalty['n_visits'] = int(line.split()[2])
+        elif line.startswith('action:'):
+            penalty['action'] = parse_value(line.split(': ', 1)[1])
+        elif line.startswith('reward:'):
+            yield ('penalty', penalty['state'], penalty['n_visits'], penalty['action'], float(line.split(': ', 1)[1]))
+            penalty = None
+
 
 def analyze_penalty_log(penalty_log):
     """
-    Given a penalty log, returns:
-    - whether the destination was reached in each trial
-    - number of penalties for each trial
-    - number of penalties with clear intersections for each trial
+    Given a penalty log, prints:
+    - the number of trials in which the destination was reached
+    - the last trial in which it was not
+    - the number of penalties, overall and during the first 50 trials
+    - the number of penalties with clear intersections, and the last
+      trial with one
+    The log is read line by line. Returns the PenaltyStats.
     """
+    stats = PenaltyStats()
     with open(penalty_log, 'r') as f:
-        string = f.read()
-        
-    trials = [patterns[0] for patterns in
-              re.findall(r'(Trial \d{1,2}.*?)(Simulator|$)', 
-                         string, re.DOTALL)]
-
-    dest_reached = [len(re.findall('reached destination', trial))
-                    for trial in trials]
-
-    penalties = [len(re.findall('penalty!', trial)) for trial in trials]
-
-    penalties_no_traffic = [len(re.findall('oncoming: None, left: None',
-                                           trial))
-                            for trial in trials]
-                                
-    print "number of destinations reached: ", sum(dest_reached)
-    print "last unreached destination: trial", max([i for i in range(len(dest_reached)) 
-                                                    if not dest_reached[i]])
-    print "total number of penalties: ", sum(penalties)
-    print "penalties during first 50 trials:", sum(penalties[:50])
-    print "total number of penalties on clear intersections:", sum(penalties_no_traffic)
-    print "last penalty on clear intersection:", max([i for i in range(len(penalties_no_traffic)) 
-                                                     if penalties_no_traffic[i]])
\ No newline at end of file
+        for event in parse_penalty_log(f):
+            stats(event)
+    stats.report()
+    return stats
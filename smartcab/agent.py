@@ -1,17 +1,17 @@
 import pandas as pd
-import random
 from environment import Agent, Environment
 from planner import RoutePlanner
+from qtable import QTable
 from simulator import Simulator
 
 class LearningAgent(Agent):
     """An agent that learns to drive in the smartcab world."""
 
-    def __init__(self, env):
+    def __init__(self, env, penalty_events=None):
         super(LearningAgent, self).__init__(env)  # sets self.env = env, state = None, next_waypoint = None, and a default color
         self.color = 'red'  # override color
         self.planner = RoutePlanner(self.env, self)  # simple route planner to get next_waypoint
-        self.qvals = {}
+        self.qvals = QTable() # q-values and visit counts of states
         self.time = 0
         self.possible_actions = (None, 'forward', 'left', 'right')
         self.n_penalties = 0
@@ -21,26 +21,23 @@ class LearningAgent(Agent):
         self.sum_time_left = 0 # sum of time left upon reaching destination over all trials
         self.n_penalties = 0 # number of penalties incurred
         self.last_penalty = 0 # last trial in which the agent incurred in a penalty
-        self.states = {} # number of times a state has been visited
+        # callable receiving trial, destination and penalty events instead
+        # of penalties being printed (e.g. analyze_penalty_log.PenaltyStats)
+        self.penalty_events = penalty_events
+        self.n_trials = 0
 
     def reset(self, destination=None):
         self.planner.route_to(destination)
+        if self.penalty_events is not None:
+            self.penalty_events(('trial', self.n_trials))
+        self.n_trials += 1
 
     def best_action(self, state):
         """
         Returns the best action (the one with the maximum Q-value)
         or one of the best actions, given a state.
         """        
-        # get all possible q-values for the state
-        all_qvals = {action: self.qvals.get((state, action), 0)
-                     for action in self.possible_actions}        
-        
-        # pick the actions that yield the largest q-value for the state
-        best_actions = [action for action in self.possible_actions 
-                        if all_qvals[action] == max(all_qvals.values())]
-        
-        # return one of the best actions at random
-        return random.choice(best_actions)        
+        return self.qvals.best_action(state)
 
     def update_qvals(self, state, action, reward):
         """
@@ -49,9 +46,7 @@ class LearningAgent(Agent):
         # define the learning rate for the current time
         learn_rate = 1.0 / self.time
         
-        self.qvals[(self.state, action)] = \
-            (1 - learn_rate) * self.qvals.get((self.state, action), 0) + \
-            learn_rate * reward
+        self.qvals.learn(self.state, action, reward, learn_rate)
 
     def update(self, t):
         # Gather inputs
@@ -66,7 +61,7 @@ class LearningAgent(Agent):
         self.state = (inputs['light'], inputs['oncoming'], inputs['left'],
                       self.next_waypoint)
         
-        self.states[self.state] = self.states.get(self.state, 0) + 1
+        n_visits = self.qvals.visit(self.state)
         
         # Pick an action
         action = self.best_action(self.state)
@@ -75,11 +70,18 @@ class LearningAgent(Agent):
         reward = self.env.act(self, action)
         
         
-        # print info about penalties
-        if reward < 0:
+        # report penalties (and arrivals) as events, or print info about
+        # penalties (unless the environment is quiet, e.g. in a headless run)
+        if self.penalty_events is not None:
+            state = self.env.agent_states[self]
+            if reward < 0:
+                self.penalty_events(('penalty', self.state, n_visits, action, reward))
+            if state['location'] == state['destination']:
+                self.penalty_events(('destination',))
+        elif reward < 0 and self.env.verbose:
             print "\npenalty!"
             print "light: {0}, oncoming: {1}, left: {2}, waypoint: {3}".format(*self.state)
-            print "visit number {} to state".format(self.states[self.state])
+            print "visit number {} to state".format(n_visits)
             print "action: {}".format(action)
             print "reward: {}\n".format(reward)
         
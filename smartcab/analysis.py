@@ -1,4 +1,6 @@
 import time
+import Queue
+import multiprocessing
 from collections import OrderedDict
 
 import numpy as np
@@ -6,15 +8,53 @@ import pandas as pd
 import matplotlib.pyplot as plt
 
 class Metric(object):
-    """Named sequence of x and y values, with optional plotting helpers."""
+    """
+    Named sequence of x and y values, with optional plotting helpers.
 
-    def __init__(self, name):
+    Values are kept in NumPy buffers that double in size when full, so
+    collecting does not allocate; xdata and ydata are views of the filled
+    part (valid until the next reset, which reuses the buffers). With a
+    window, the sum of the last window y values is kept up to date as
+    values come in.
+    """
+
+    def __init__(self, name, window=None, capacity=64):
         self.name = name
+        self.window = window
+        self._x = np.empty(capacity)
+        self._y = np.empty(capacity)
         self.reset()
 
+    @property
+    def xdata(self):
+        return self._x[:self.n]
+
+    @property
+    def ydata(self):
+        return self._y[:self.n]
+
     def collect(self, x, y):
-        self.xdata.append(x)
-        self.ydata.append(y)
+        if self.n == len(self._y):
+            self.grow()
+        self._x[self.n] = x
+        self._y[self.n] = y
+        self.n += 1
+        if self.window is not None:
+            self.window_sum += y
+            if self.n > self.window:
+                self.window_sum -= self._y[self.n - self.window - 1]
+
+    def grow(self):
+        """Double the buffers."""
+        for name in ('_x', '_y'):
+            old = getattr(self, name)
+            new = np.empty(2 * len(old))
+            new[:self.n] = old[:self.n]
+            setattr(self, name, new)
+
+    def window_mean(self):
+        """Mean of the last window y values (or of all of them, while there are fewer)."""
+        return self.window_sum / min(self.n, self.window) if self.n else np.nan
 
     def plot(self, ax):
         self.plot_obj, = ax.plot(self.xdata, self.ydata, 'o-', label=self.name)
@@ -23,37 +63,155 @@ class Metric(object):
         self.plot_obj.set_data(self.xdata, self.ydata)
 
     def reset(self):
-        self.xdata = []
-        self.ydata = []
+        self.n = 0
+        self.window_sum = 0.0
+
+
+def plot_process(queue, names, max_fps):
+    """
+    Plot metrics sent over queue (see LivePlot) until told to stop, then
+    keep the final plot open until its window is closed.
+    """
+    fig, ax = plt.subplots()
+    data = OrderedDict((name, ([], [])) for name in names)
+    lines = {name: ax.plot([], [], 'o-', label=name, animated=True)[0] for name in names}
+    ax.grid()
+    ax.legend()
+    plt.show(block=False)
+    fig.canvas.draw()
+    background = fig.canvas.copy_from_bbox(ax.bbox)
+
+    def add_metric(name):
+        data[name] = ([], [])
+        lines[name], = ax.plot([], [], 'o-', label=name, animated=True)
+        ax.legend()
+
+    bounds = [np.inf, -np.inf, np.inf, -np.inf]  # of all data received, as x_min, x_max, y_min, y_max
+
+    done = False
+    while not done:
+        # take everything sent since the last frame
+        changed = False
+        try:
+            message = queue.get(timeout=1.0 / max_fps)
+            while True:
+                if message is None:
+                    done = True
+                elif message == 'reset':
+                    for xdata, ydata in data.itervalues():
+                        del xdata[:], ydata[:]
+                    bounds = [np.inf, -np.inf, np.inf, -np.inf]
+                else:
+                    for name, x, y in message:
+                        if name not in data:
+                            add_metric(name)
+                        data[name][0].extend(x)
+                        data[name][1].extend(y)
+                        bounds = [min(bounds[0], min(x)), max(bounds[1], max(x)),
+                                  min(bounds[2], min(y)), max(bounds[3], max(y))]
+                changed = True
+                message = queue.get_nowait()
+        except Queue.Empty:
+            pass
+
+        if changed:
+            for name, (xdata, ydata) in data.iteritems():
+                lines[name].set_data(xdata, ydata)
+            # only redraw axes when the data outgrows them, else blit the lines;
+            # an outgrown axis is set from the data with room to spare (twice
+            # the x span, a quarter of the y range on either side)
+            (x_lo, x_hi), (y_lo, y_hi) = ax.get_xlim(), ax.get_ylim()
+            x_out = bounds[0] < x_lo or bounds[1] > x_hi
+            y_out = bounds[2] < y_lo or bounds[3] > y_hi
+            if x_out:
+                ax.set_xlim(bounds[0], bounds[0] + 2 * max(bounds[1] - bounds[0], 1))
+            if y_out:
+                pad = 0.25 * max(bounds[3] - bounds[2], 1)
+                ax.set_ylim(bounds[2] - pad, bounds[3] + pad)
+            if x_out or y_out:
+                fig.canvas.draw()
+                background = fig.canvas.copy_from_bbox(ax.bbox)
+            fig.canvas.restore_region(background)
+            for line in lines.itervalues():
+                ax.draw_artist(line)
+            fig.canvas.blit(ax.bbox)
+        fig.canvas.flush_events()
+
+    # final, static plot
+    for line in lines.itervalues():
+        line.set_animated(False)
+    ax.set_autoscale_on(True)  # the live limits turned it off
+    ax.relim()
+    ax.autoscale_view()
+    plt.show()
+
+
+class LivePlot(object):
+    """
+    Plots metrics in a separate process, so the simulation never waits
+    for matplotlib.
+
+    update() sends the values collected since the previous update (at most
+    max_fps times per second, never blocking); the plotting process blits
+    the new lines and only redraws the axes when the data outgrows them.
+    """
+
+    def __init__(self, names, max_fps=10):
+        self.max_fps = max_fps
+        self.sent = {}  # number of values of each metric sent so far
+        self.last_sent = 0.0
+        self.queue = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=plot_process, args=(self.queue, list(names), max_fps))
+        self.process.daemon = True
+        self.process.start()
+
+    def update(self, metrics, force=False):
+        now = time.time()
+        if not force and now - self.last_sent < 1.0 / self.max_fps:
+            return
+        if not self.process.is_alive():
+            return  # plot window closed (or failed to open)
+        message = []
+        for name, metric in metrics.iteritems():
+            sent = self.sent.get(name, 0)
+            if metric.n > sent:
+                message.append((name, metric.xdata[sent:].tolist(), metric.ydata[sent:].tolist()))
+                self.sent[name] = metric.n
+        if message:
+            self.queue.put(message)
+        self.last_sent = now
+
+    def reset(self):
+        self.sent.clear()
+        self.queue.put('reset')
+
+    def close(self, metrics):
+        """Send the remaining values, then wait for the plot window to be closed."""
+        self.update(metrics, force=True)
+        self.queue.put(None)
+        self.process.join()
 
 
 class Reporter(object):
     """Collect metrics, analyze and report summary statistics."""
 
-    def __init__(self, metrics=[], live_plot=False):
+    def __init__(self, metrics=[], live_plot=False, windows={}):
         self.metrics = OrderedDict()
         self.live_plot = live_plot
 
         for name in metrics:
-            self.metrics[name] = Metric(name)
+            self.metrics[name] = Metric(name, window=windows.get(name))
 
         if self.live_plot:
-            if not plt.isinteractive():
-                plt.ion()
-            self.plot()
+            self.live = LivePlot(self.metrics)
 
         # print "Reporter.__init__(): Initialized with metrics: {}".format(metrics)  # [debug]
 
     def collect(self, name, x, y):
         if not name in self.metrics:
             self.metrics[name] = Metric(name)
-            if self.live_plot:
-                self.metrics[name].plot(self.ax)
-                self.ax.legend()  # add new metric to legend
             # print "Reporter.collect(): New metric added: {}".format(name)  # [debug]
         self.metrics[name].collect(x, y)
-        if self.live_plot:
-            self.metrics[name].refresh()
 
     def plot(self):
         if not hasattr(self, 'fig') or not hasattr(self, 'ax'):
@@ -70,6 +228,9 @@ class Reporter(object):
         self.refresh_plot()
 
     def refresh_plot(self):
+        if self.live_plot:
+            self.live.update(self.metrics)  # returns at once, the plot catches up on its own
+            return
         self.ax.relim()
         self.ax.autoscale_view()
         self.fig.canvas.draw()
@@ -77,23 +238,26 @@ class Reporter(object):
         plt.draw()
 
     def show_plot(self):
+        if self.live_plot:
+            self.live.close(self.metrics)  # holds till user closes plot window
+            return
         if plt.isinteractive():
             plt.ioff()
         self.plot()
         plt.show()
 
     def summary(self):
-        return [pd.Series(metric.ydata, index=metric.xdata, name=name) for name, metric in self.metrics.iteritems()]
+        # Series share the metric buffers (see Metric)
+        return [pd.Series(metric.ydata, index=metric.xdata, name=name, copy=False) for name, metric in self.metrics.iteritems()]
 
     def reset(self):
         for name in self.metrics:
             self.metrics[name].reset()
-            if self.live_plot:
-                self.metrics[name].refresh()
+        if self.live_plot:
+            self.live.reset()
 
 
 def test_reporter():
-    plt.ion()
     rep = Reporter(metrics=['reward', 'flubber'], live_plot=True)
     for i in xrange(100):
         rep.collect('reward', i, np.random.random())
@@ -101,15 +265,13 @@ def test_reporter():
             rep.collect('flubber', i, np.random.random() * 2 + 1)
             rep.refresh_plot()
         time.sleep(0.01)
-    rep.plot()
     summary = rep.summary()
     # print "Summary ({} metrics):-".format(len(summary))
     # for metric in summary:
         # print "Name: {}, samples: {}, type: {}".format(metric.name, len(metric), metric.dtype)
         # print "Mean: {}, s.d.: {}".format(metric.mean(), metric.std())
         #print metric[:5]  # [debug]
-    plt.ioff()
-    plt.show()
+    rep.show_plot()
 
 
 if __name__ == '__main__':
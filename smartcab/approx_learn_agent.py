@@ -1,46 +1,104 @@
-import pandas as pd
+import time
 import random
+import numpy as np
 from learning_agent import LearningAgent
+from qtable import QTable
 from sklearn.tree import DecisionTreeRegressor
 
 class ApproxLearnAgent(LearningAgent):
     """An agent that learns to drive in the smartcab world."""
 
-    def __init__ (self, env):
+    def __init__ (self, env, refit_every=10, refit_growth=0.1):
         super(LearningAgent, self).__init__(env)
-        self.df_qv = pd.DataFrame()
         self.rgr = DecisionTreeRegressor()
         self.numbers = {'red': 0, 'green': 1, None: 0, 'left': 1,
                         'right': 2, 'forward': 3}
+        # q-values are keyed on numeric states and actions (see numerify)
+        self.qvals = QTable(state_values=((0, 1), (0, 1, 2, 3), (0, 1, 2, 3),
+                                          (0, 1, 2, 3)),
+                            actions=[self.numbers[action]
+                                     for action in self.possible_actions])
+
+        # training buffer: one row per (numeric state, action) pair,
+        # appended when the pair gets its first q-value
+        size = self.qvals.values.size
+        self.X = np.zeros((size, 5))
+        self.y = np.zeros(size)
+        self.rows = {} # maps (numeric state, action) pairs to buffer rows
+        self.n_rows = 0
+
+        # refit schedule: after refit_every steps, or once the buffer
+        # has grown by more than refit_growth (a fraction, None to ignore
+        # growth) since the last fit; refit_every=1 fits before every decision
+        self.refit_every = refit_every
+        self.refit_growth = refit_growth
+        self.fit_step = None # time of the last fit
+        self.fit_rows = 0 # buffer size at the last fit
+
+        # every (numeric state, action) combination, in q-table order,
+        # and the q-values the regressor predicts for them after each fit
+        self.X_all = np.array([state + (action,)
+                               for state in self.qvals.states
+                               for action in self.qvals.actions])
+        self.predictions = None
+
+        # timing counters
+        self.n_fits = 0
+        self.fit_time = 0.0
+        self.n_predicts = 0
+        self.predict_time = 0.0
+
+    def needs_refit(self):
+        return (self.fit_step is None or
+                self.time - self.fit_step >= self.refit_every or
+                (self.refit_growth is not None and
+                 self.n_rows > self.fit_rows * (1 + self.refit_growth)))
+
+    def refit(self):
+        """
+        Fits the regressor on the training buffer and predicts
+        the q-values of every (state, action) pair in one go
+        """
+        start = time.time()
+        self.rgr.fit(self.X[:self.n_rows], self.y[:self.n_rows])
+        self.fit_time += time.time() - start
+        self.n_fits += 1
+        self.fit_step = self.time
+        self.fit_rows = self.n_rows
+
+        start = time.time()
+        self.predictions = self.rgr.predict(self.X_all).reshape(
+            self.qvals.values.shape)
+        self.predict_time += time.time() - start
+        self.n_predicts += 1
 
     def best_action(self, state):
         """
         Returns the best action (the one with the maximum Q-value)
         or one of the best actions, given a state.
         """
-        if self.df_qv.shape[0] < 10:
-            return random.choice(self.possible_actions)                         
-        
+        if self.n_rows < 10:
+            return random.choice(self.possible_actions)
+
         numeric_state = self.numerify(state)
-        
-        X = self.df_qv.iloc[:,:-1]
-        y = self.df_qv.iloc[:,-1]
-        
-        # fit classifier
-        self.rgr.fit(X, y)
-        
-        # get all possible sets of variables in state + action
-        X_pred = [numeric_state + tuple([self.numbers[action]])
-                  for action in self.possible_actions]
-        results = self.rgr.predict(X_pred)
-        best_numeric_actions = [X_pred[i][-1] for i in range(len(X_pred))
-                                if results[i] == max(results)]
-        
-        best_actions = [action for action in self.possible_actions
-                        if self.numbers[action] in best_numeric_actions]        
-        
+
+        # fit regressor (only when the schedule says so)
+        if self.needs_refit():
+            self.refit()
+
+        # look up the predicted q-values of the state's actions
+        # (q-table actions are in the same order as possible_actions)
+        results = self.predictions[self.qvals.state_index[numeric_state]]
+        best_actions = np.flatnonzero(results == results.max())
+
         # return one of the best actions at random
-        return random.choice(best_actions)        
+        return self.possible_actions[random.choice(best_actions)]
+
+    def visit(self, state):
+        """
+        Counts a visit to the state
+        """
+        self.qvals.visit(self.numerify(state))
 
     def update_qvals(self, state, action, reward):
         """
@@ -50,17 +108,16 @@ class ApproxLearnAgent(LearningAgent):
         learn_rate = 1.0 / self.time
         numeric_state = self.numerify(state)
         numeric_action = self.numbers[action]
-        
-        self.qvals[(numeric_state, numeric_action)] = \
-            (1 - learn_rate) * self.qvals.get((numeric_state, numeric_action), 
-                                              0) + \
-            learn_rate * reward
-        
-        # turn qvals into a dataframe
-        self.df_qv = pd.DataFrame([[item for item in pair[0]] + 
-                                   [pair[1]] +
-                                   [self.qvals[pair]] 
-                                   for pair in self.qvals])
-                                       
+
+        self.qvals.learn(numeric_state, numeric_action, reward, learn_rate)
+
+        # update the training buffer
+        pair = (numeric_state, numeric_action)
+        if pair not in self.rows:
+            self.rows[pair] = self.n_rows
+            self.X[self.n_rows] = numeric_state + (numeric_action,)
+            self.n_rows += 1
+        self.y[self.rows[pair]] = self.qvals[pair]
+
     def numerify(self, state):
-        return tuple([self.numbers[item] for item in state])
\ No newline at end of file
+        return tuple([self.numbers[item] for item in state])
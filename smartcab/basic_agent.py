@@ -1,6 +1,7 @@
 import random
 from environment import Agent
 from planner import RoutePlanner
+from qtable import QTable
 
 class BasicAgent(Agent):
     """A basic agent upon which to build learning agents."""
@@ -9,7 +10,7 @@ class BasicAgent(Agent):
         super(BasicAgent, self).__init__(env)  # sets self.env = env, state = None, next_waypoint = None, and a default color
         self.color = 'red'  # override color
         self.planner = RoutePlanner(self.env, self)  # simple route planner to get next_waypoint
-        self.qvals = {} # mapping (state, action) to q-values
+        self.qvals = QTable() # mapping (state, action) to q-values
         self.time = 0 # number of moves performed
         self.possible_actions = (None, 'forward', 'left', 'right')
         self.n_dest_reached = 0 # number of destinations reached
@@ -27,6 +28,12 @@ class BasicAgent(Agent):
         """
         return random.choice(self.possible_actions)
 
+    def visit(self, state):
+        """
+        Counts a visit to the state
+        """
+        self.qvals.visit(state)
+
     def update_qvals(self, state, action, reward):
         """
         Keeps track of visited (state, action) pairs. 
@@ -47,6 +54,7 @@ class BasicAgent(Agent):
         # Update state
         self.state = (inputs['light'], inputs['oncoming'], inputs['left'],
                       self.next_waypoint)
+        self.visit(self.state)
 
         # Pick an action
         action = self.best_action(self.state)
@@ -0,0 +1,246 @@
+import numpy as np
+
+from environment import Environment
+
+# integer codes for actions/waypoints (indices into Environment.valid_actions)
+NONE, FORWARD, LEFT, RIGHT = range(len(Environment.valid_actions))
+
+
+class BatchEnvironment(object):
+    """
+    N independent smartcab worlds stepped together.
+
+    Every world has the same layout as Environment: num_dummies dummy agents
+    followed by one primary agent (agent index num_dummies), all on a grid
+    of the same size. Locations, headings, waypoints, traffic lights and deadlines
+    are kept in NumPy arrays and each step is vectorized over the worlds.
+    Agents still move one after the other inside a world, exactly as in
+    Environment.step, so sense/act semantics and rewards are unchanged.
+
+    Actions, waypoints and the 'oncoming'/'left'/'right' inputs are integer
+    codes (indices into Environment.valid_actions); 'light' is a boolean
+    array that is True where the light is green.
+    """
+
+    valid_actions = Environment.valid_actions
+    valid_headings = np.array(Environment.valid_headings)
+    hard_time_limit = Environment.hard_time_limit
+
+    def __init__(self, n_worlds, num_dummies=3, grid_size=(8, 6), enforce_deadline=False, seed=None):
+        self.n_worlds = n_worlds
+        self.num_dummies = num_dummies
+        self.n_agents = num_dummies + 1
+        self.primary = num_dummies  # primary agent is created last
+        self.enforce_deadline = enforce_deadline
+        self.random = np.random.RandomState(seed)
+
+        # Road network (same as Environment)
+        self.grid_size = tuple(grid_size)  # (cols, rows)
+        self.bounds = (1, 1, self.grid_size[0], self.grid_size[1])
+        self.span = np.array([self.bounds[2] - self.bounds[0] + 1, self.bounds[3] - self.bounds[1] + 1])
+        self.origin = np.array(self.bounds[:2])
+
+        # Traffic lights, one per intersection and world
+        shape = (n_worlds,) + self.grid_size
+        self.light_state = self.random.rand(*shape) < 0.5  # True = NS open, False = EW open
+        self.light_period = self.random.choice([3, 4, 5], size=shape)
+        self.light_updated = np.zeros(shape, dtype=int)
+
+        # Agents: dummies start heading south at random intersections
+        self.location = self.random_locations((n_worlds, self.n_agents))
+        self.heading = np.zeros((n_worlds, self.n_agents, 2), dtype=int)
+        self.heading[:, :, 1] = 1
+        self.waypoint = self.random.randint(FORWARD, RIGHT + 1, size=(n_worlds, self.n_agents))
+        self.waypoint[:, self.primary] = NONE
+        self.destination = np.zeros((n_worlds, 2), dtype=int)
+        self.deadline = np.zeros(n_worlds, dtype=int)
+
+        # Simulation variables
+        self.t = np.zeros(n_worlds, dtype=int)
+        self.done = np.zeros(n_worlds, dtype=bool)
+
+        # Trial data (updated at the end of each trial)
+        self.net_reward = np.zeros(n_worlds)
+        self.final_deadline = np.zeros(n_worlds, dtype=int)
+        self.success = np.zeros(n_worlds, dtype=int)
+
+        # Primary agent statistics (accumulated over trials)
+        self.n_dest_reached = np.zeros(n_worlds, dtype=int)
+        self.sum_time_left = np.zeros(n_worlds, dtype=int)
+
+    def random_locations(self, size):
+        return self.origin + (self.random.rand(*(size + (2,))) * self.span).astype(int)
+
+    def random_headings(self, size):
+        return self.valid_headings[self.random.randint(len(self.valid_headings), size=size)]
+
+    def reset(self, worlds=None):
+        """Start a new trial in the given worlds (boolean mask; default: all)."""
+        worlds = np.ones(self.n_worlds, dtype=bool) if worlds is None else np.array(worlds, dtype=bool)
+        n = worlds.sum()
+        self.done[worlds] = False
+        self.t[worlds] = 0
+
+        # Reset traffic lights
+        self.light_updated[worlds] = 0
+
+        # Pick a start and a destination, not too close to each other
+        start = self.random_locations((n,))
+        destination = self.random_locations((n,))
+        too_close = np.abs(destination - start).sum(axis=1) < 4
+        while too_close.any():
+            start[too_close] = self.random_locations((too_close.sum(),))
+            destination[too_close] = self.random_locations((too_close.sum(),))
+            too_close = np.abs(destination - start).sum(axis=1) < 4
+        deadline = np.abs(destination - start).sum(axis=1) * 5
+
+        # Initialize agents
+        location = self.random_locations((n, self.n_agents))
+        heading = self.random_headings((n, self.n_agents))
+        location[:, self.primary] = start
+        self.location[worlds] = location
+        self.heading[worlds] = heading
+        self.destination[worlds] = destination
+        self.deadline[worlds] = deadline
+
+        # Reset metrics for this trial
+        self.net_reward[worlds] = 0.0
+        self.final_deadline[worlds] = deadline
+        self.success[worlds] = 0
+
+    def update_lights(self, worlds):
+        t = self.t[:, None, None]
+        switch = worlds[:, None, None] & (t - self.light_updated >= self.light_period)
+        self.light_state ^= switch
+        self.light_updated = np.where(switch, t, self.light_updated)
+
+    def next_waypoint(self, worlds):
+        """Vectorized planner.RoutePlanner.next_waypoint for the primary agents."""
+        location = self.location[:, self.primary]
+        heading = self.heading[:, self.primary]
+        dx, dy = (self.destination - location).T
+        hx, hy = heading.T
+        waypoint = np.select(
+            [(dx != 0) & (dx * hx > 0), (dx != 0) & (dx * hx < 0), (dx != 0) & (dx * hy > 0), dx != 0,
+             (dy != 0) & (dy * hy > 0), (dy != 0) & (dy * hy < 0), (dy != 0) & (dy * hx > 0), dy != 0],
+            [FORWARD, RIGHT, LEFT, RIGHT,
+             FORWARD, RIGHT, RIGHT, LEFT], NONE)
+        self.waypoint[:, self.primary] = np.where(worlds, waypoint, self.waypoint[:, self.primary])
+        return self.waypoint[:, self.primary]
+
+    def sense(self, agent):
+        """Inputs for the agent with the given index, in every world."""
+        location = self.location[:, agent]
+        heading = self.heading[:, agent]
+        worlds = np.arange(self.n_worlds)
+        ns_open = self.light_state[worlds, location[:, 0] - self.bounds[0], location[:, 1] - self.bounds[1]]
+        light = (ns_open & (heading[:, 1] != 0)) | (~ns_open & (heading[:, 0] != 0))
+
+        # Populate oncoming, left, right (in agent order, as Environment.sense does)
+        oncoming = np.zeros(self.n_worlds, dtype=int)
+        left = np.zeros(self.n_worlds, dtype=int)
+        right = np.zeros(self.n_worlds, dtype=int)
+        for other in xrange(self.n_agents):
+            if other == agent:
+                continue
+            other_heading = self.heading[:, other]
+            present = (self.location[:, other] == location).all(axis=1) & (other_heading != heading).any(axis=1)
+            is_oncoming = present & ((heading * other_heading).sum(axis=1) == -1)
+            is_right = present & ~is_oncoming & (heading[:, 1] == other_heading[:, 0]) & (-heading[:, 0] == other_heading[:, 1])
+            is_left = present & ~is_oncoming & ~is_right
+            other_waypoint = self.waypoint[:, other]
+            oncoming = np.where(is_oncoming & (oncoming != LEFT), other_waypoint, oncoming)
+            right = np.where(is_right & (right != FORWARD) & (right != LEFT), other_waypoint, right)
+            left = np.where(is_left & (left != FORWARD), other_waypoint, left)
+
+        return {'light': light, 'oncoming': oncoming, 'left': left, 'right': right}
+
+    def act(self, agent, action, inputs, worlds):
+        """Apply the actions of one agent in the given worlds; return rewards."""
+        action = np.asarray(action)
+        light = inputs['light']
+        heading = self.heading[:, agent]
+        hx, hy = heading.T
+
+        # Move agent if it obeys traffic rules
+        move_okay = np.select(
+            [action == FORWARD, action == LEFT, action == RIGHT],
+            [light, light & ((inputs['oncoming'] == NONE) | (inputs['oncoming'] == LEFT)), light | (inputs['left'] != FORWARD)],
+            True)
+        moved = worlds & move_okay & (action != NONE)
+        turned_left = (moved & (action == LEFT))[:, None]
+        turned_right = (moved & (action == RIGHT))[:, None]
+        heading = np.where(turned_left, np.stack([hy, -hx], axis=1),
+                           np.where(turned_right, np.stack([-hy, hx], axis=1), heading))
+        location = (self.location[:, agent] + heading - self.origin) % self.span + self.origin  # wrap-around
+        self.location[:, agent] = np.where(moved[:, None], location, self.location[:, agent])
+        self.heading[:, agent] = heading
+
+        reward = np.where(~move_okay, -1.0,
+                          np.where(action == NONE, 0.0,
+                                   np.where(action == self.waypoint[:, agent], 2.0, -0.5)))
+        reward[~worlds] = 0.0
+
+        if agent == self.primary:
+            reached = worlds & (self.location[:, agent] == self.destination).all(axis=1)
+            in_time = reached & (self.deadline >= 0)
+            reward[in_time] += 10  # bonus
+            self.n_dest_reached += in_time
+            self.sum_time_left[in_time] += self.deadline[in_time]
+            self.success[in_time] = 1
+            self.done |= reached
+
+            # Update metrics
+            self.final_deadline[worlds] = self.deadline[worlds]
+            self.net_reward += reward
+
+        return reward
+
+    def update_dummy(self, agent, worlds):
+        """Vectorized DummyAgent.update."""
+        inputs = self.sense(agent)
+        light = inputs['light']
+        waypoint = self.waypoint[:, agent]
+        action_okay = np.select(
+            [waypoint == RIGHT, waypoint == FORWARD, waypoint == LEFT],
+            [light | (inputs['left'] != FORWARD), light,
+             light & (inputs['oncoming'] != FORWARD) & (inputs['oncoming'] != RIGHT)],
+            True)
+        action = np.where(action_okay, waypoint, NONE)
+        new_waypoint = self.random.randint(FORWARD, RIGHT + 1, size=self.n_worlds)
+        self.waypoint[:, agent] = np.where(worlds & action_okay, new_waypoint, waypoint)
+        self.act(agent, action, inputs, worlds)
+
+    def step(self, policy):
+        """
+        Advance every unfinished world by one time step.
+
+        policy is called as policy(inputs, waypoint, deadline) with the
+        primary agents' sensed inputs, planner waypoints and deadlines, and
+        must return one action code per world. Returns the step data
+        (inputs, waypoint, action, reward) as a dict of arrays.
+        """
+        worlds = ~self.done
+
+        # Update traffic lights
+        self.update_lights(worlds)
+
+        # Update agents (dummies first, then the primary agent)
+        for agent in xrange(self.num_dummies):
+            self.update_dummy(agent, worlds)
+
+        waypoint = self.next_waypoint(worlds)
+        inputs = self.sense(self.primary)
+        action = np.asarray(policy(inputs, waypoint, self.deadline))
+        action = np.where(worlds, action, NONE)
+        reward = self.act(self.primary, action, inputs, worlds)
+
+        # Worlds where the primary agent reached its destination are done
+        worlds &= ~self.done
+        self.done |= worlds & (self.deadline <= self.hard_time_limit)
+        if self.enforce_deadline:
+            self.done |= worlds & (self.deadline <= 0)
+        self.deadline[worlds] -= 1
+        self.t[worlds] += 1
+
+        return {'inputs': inputs, 'waypoint': waypoint, 'action': action, 'reward': reward}
@@ -0,0 +1,147 @@
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+from collections import OrderedDict
+
+import numpy as np
+
+from environment import Environment
+from simulator import HeadlessSimulator
+from result_cache import source_hash
+from basic_agent import BasicAgent
+from learning_agent import LearningAgent
+from optimistic_agent import OptimisticAgent
+from perfect_agent import PerfectAgent
+from new_state_agent import NewStateAgent
+from learning_random_agent import LearningRandomAgent
+import similarity_agent
+from approx_learn_agent import ApproxLearnAgent
+
+# agent classes and their constructor arguments
+agents = OrderedDict([('BasicAgent', (BasicAgent, ())),
+                      ('LearningAgent', (LearningAgent, ())),
+                      ('OptimisticAgent', (OptimisticAgent, ())),
+                      ('PerfectAgent', (PerfectAgent, ())),
+                      ('NewStateAgent', (NewStateAgent, ())),
+                      ('LearningRandomAgent', (LearningRandomAgent, (0.01,))),
+                      ('SimilarityAgent', (similarity_agent.LearningAgent, ())),
+                      ('ApproxLearnAgent', (ApproxLearnAgent, ()))])
+grid_sizes = [(8, 6), (16, 12), (32, 24)]
+dummy_counts = [3, 20, 100]
+
+
+def bench(agent, args=(), grid_size=(8, 6), num_dummies=3, n_trials=10, seed=0, repeat=3):
+    """
+    Time n_trials of the agent (created as agent(env, *args)) in a
+    headless simulation seeded with seed, so every repetition does the
+    same work. Returns the number of steps and trials, and the best time
+    over repeat runs.
+    """
+    best = None
+    for _ in xrange(repeat):
+        random.seed(seed)
+        np.random.seed(seed)
+        e = Environment(num_dummies=num_dummies, grid_size=grid_size)
+        a = e.create_agent(agent, *args)
+        e.set_primary_agent(a, enforce_deadline=True)
+        sim = HeadlessSimulator(e)
+
+        n_steps = [0]
+        step = e.step
+        def counted_step():
+            n_steps[0] += 1
+            step()
+        e.step = counted_step
+
+        start = time.time()
+        sim.run(n_trials)
+        seconds = time.time() - start
+        if best is None or seconds < best:
+            best = seconds
+    return OrderedDict([('steps', n_steps[0]), ('trials', n_trials), ('seconds', best),
+                        ('steps_per_second', n_steps[0] / best), ('trials_per_second', n_trials / best)])
+
+
+def run_suite(agent_names=None, grid_sizes=grid_sizes, dummy_counts=dummy_counts,
+              n_trials=10, seed=0, repeat=3, verbose=True):
+    """Benchmark every agent on every grid size and number of dummies."""
+    results = []
+    for name in agent_names or agents.keys():
+        for grid_size in grid_sizes:
+            for num_dummies in dummy_counts:
+                result = OrderedDict([('agent', name), ('grid_size', list(grid_size)),
+                                      ('num_dummies', num_dummies), ('seed', seed)])
+                result.update(bench(agents[name][0], agents[name][1], grid_size, num_dummies, n_trials, seed, repeat))
+                results.append(result)
+                if verbose:
+                    print "{agent:20} {grid_size!s:10} {num_dummies:4} dummies: " \
+                          "{steps_per_second:9.0f} steps/s {trials_per_second:8.1f} trials/s".format(**result)
+    return results
+
+
+def save(results, path):
+    report = OrderedDict([('python', platform.python_version()), ('numpy', np.__version__),
+                          ('platform', platform.platform()), ('source_hash', source_hash()),
+                          ('time', time.strftime('%Y-%m-%dT%H:%M:%S')), ('results', results)])
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)['results']
+
+
+def compare(results, baseline, tolerance=0.1):
+    """
+    Compare results with baseline results of the same configurations.
+    Returns the regressions (steps/s more than tolerance below the
+    baseline) and the configurations whose number of steps changed, i.e.
+    whose simulation no longer does the same work.
+    """
+    def key(result):
+        return result['agent'], tuple(result['grid_size']), result['num_dummies'], result['trials'], result['seed']
+
+    reference = {key(result): result for result in baseline}
+    regressions, changed = [], []
+    for result in results:
+        base = reference.get(key(result))
+        if base is None:
+            continue
+        if result['steps'] != base['steps']:
+            changed.append((key(result), base['steps'], result['steps']))
+        ratio = result['steps_per_second'] / base['steps_per_second']
+        if ratio < 1 - tolerance:
+            regressions.append((key(result), base['steps_per_second'], result['steps_per_second'], ratio))
+    return regressions, changed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Throughput benchmark of the smartcab agents.")
+    parser.add_argument('output', help="JSON file to write the results to")
+    parser.add_argument('--baseline', help="JSON results to compare with")
+    parser.add_argument('--agents', nargs='+', choices=agents.keys())
+    parser.add_argument('--trials', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.agents, n_trials=args.trials, seed=args.seed, repeat=args.repeat)
+    save(results, args.output)
+    if args.baseline is None:
+        return 0
+
+    regressions, changed = compare(results, load(args.baseline), args.tolerance)
+    for key, before, after in changed:
+        print "changed: {} took {} steps, {} before".format(key, after, before)
+    for key, before, after, ratio in regressions:
+        print "REGRESSION: {} {:.0f} steps/s, {:.0f} before ({:.0%})".format(key, after, before, ratio - 1)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
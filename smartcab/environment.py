@@ -1,26 +1,38 @@
 import time
 import random
-from collections import OrderedDict
+import bisect
+from collections import OrderedDict, defaultdict
+
+import numpy as np
 
 from simulator import Simulator
 
 class TrafficLight(object):
-    """A traffic light that switches periodically."""
+    """
+    A traffic light that switches periodically.
+
+    The light switches at every multiple of its period since its cycle
+    (re)started, so its state at any time t follows from the state it
+    started with; nothing needs updating between queries.
+    """
 
     valid_states = [True, False]  # True = NS open, False = EW open
+    valid_periods = [3, 4, 5]
 
     def __init__(self, state=None, period=None):
-        self.state = state if state is not None else random.choice(self.valid_states)
-        self.period = period if period is not None else random.choice([3, 4, 5])
-        self.last_updated = 0
+        self.initial_state = state if state is not None else random.choice(self.valid_states)
+        self.period = period if period is not None else random.choice(self.valid_periods)
 
-    def reset(self):
-        self.last_updated = 0
+    def reset(self, t=0):
+        """Restart the cycle from the state the light had at time t."""
+        self.initial_state = self.state_at(t)
 
-    def update(self, t):
-        if t - self.last_updated >= self.period:
-            self.state = not self.state  # assuming state is boolean
-            self.last_updated = t
+    def state_at(self, t):
+        return self.initial_state != ((t // self.period) % 2 == 1)  # switched an odd number of times
+
+    def switches(self, t):
+        """Whether the light switches at time t."""
+        return t > 0 and t % self.period == 0
 
 
 class Environment(object):
@@ -31,35 +43,42 @@ class Environment(object):
     valid_headings = [(1, 0), (0, -1), (-1, 0), (0, 1)]  # ENWS
     hard_time_limit = -100  # even if enforce_deadline is False, end trial when deadline reaches this value (to avoid deadlocks)
 
-    def __init__(self, num_dummies=3):
+    def __init__(self, num_dummies=3, grid_size=(8, 6), dummy_traffic=False):
         self.num_dummies = num_dummies  # no. of dummy agents
         
         # Initialize simulation variables
         self.done = False
         self.t = 0
+        self.light_t = 0  # time of the latest light update (lights are evaluated at this time)
         self.agent_states = OrderedDict()
+        self.agent_order = {}  # creation index of each agent
+        self.sense_cache = {}  # sensed inputs of each agent, valid until its intersection changes
         self.status_text = ""
+        self.verbose = True  # print arrivals and keep status_text (headless runs turn this off)
 
         # Road network
-        self.grid_size = (8, 6)  # (cols, rows)
+        self.grid_size = tuple(grid_size)  # (cols, rows)
         self.bounds = (1, 1, self.grid_size[0], self.grid_size[1])
         self.block_size = 100
         self.intersections = OrderedDict()
-        self.roads = []
         for x in xrange(self.bounds[0], self.bounds[2] + 1):
             for y in xrange(self.bounds[1], self.bounds[3] + 1):
                 self.intersections[(x, y)] = TrafficLight()  # a traffic light at each intersection
+        self.occupants = defaultdict(list)  # (creation index, agent) pairs at each intersection
+        self.road_from, self.road_to = self.build_roads()
+        self._roads = None
+
+        self.route_engine = None  # shortest paths over the roads (see route_engine.RouteEngine.of)
 
-        for a in self.intersections:
-            for b in self.intersections:
-                if a == b:
-                    continue
-                if (abs(a[0] - b[0]) + abs(a[1] - b[1])) == 1:  # L1 distance = 1
-                    self.roads.append((a, b))
+        # Pre-generated trials replayed by reset (see use_scenarios)
+        self.scenarios = None
+        self.scenario_index = 0
 
-        # Dummy agents
-        for i in xrange(self.num_dummies):
-            self.create_agent(DummyAgent)
+        # Dummy agents (as agent objects, or as arrays updated together)
+        self.traffic = DummyTraffic(self, self.num_dummies) if dummy_traffic else None
+        if self.traffic is None:
+            for i in xrange(self.num_dummies):
+                self.create_agent(DummyAgent)
 
         # Primary agent and associated parameters
         self.primary_agent = None  # to be set explicitly
@@ -72,7 +91,9 @@ class Environment(object):
             'waypoint': None,
             'inputs': None,
             'action': None,
-            'reward': 0.0
+            'reward': 0.0,
+            'location': None,  # where the action was taken
+            'heading': None
         }
 
         # Trial data (updated at the end of each trial)
@@ -82,43 +103,135 @@ class Environment(object):
             'success': 0  # whether the agent reached the destination in time
         }
 
+    def build_roads(self):
+        """
+        Roads between neighbouring intersections (both ways), as two arrays
+        of intersection indices (in the order of self.intersections).
+        Built in time linear in the number of intersections.
+        """
+        cols, rows = self.grid_size
+        index = np.arange(cols * rows).reshape(cols, rows)
+        road_from, road_to = [], []
+        for dx, dy in [(-1, 0), (0, -1), (0, 1), (1, 0)]:  # neighbours in intersection order
+            a = index[max(0, -dx):cols - max(0, dx), max(0, -dy):rows - max(0, dy)]
+            road_from.append(a.ravel())
+            road_to.append((a + dx * rows + dy).ravel())
+        road_from, road_to = np.concatenate(road_from), np.concatenate(road_to)
+        order = np.argsort(road_from, kind='mergesort')  # roads grouped by start, stable
+        return road_from[order], road_to[order]
+
+    def intersection(self, index):
+        """Coordinates of the intersection with the given index."""
+        return (self.bounds[0] + index // self.grid_size[1], self.bounds[1] + index % self.grid_size[1])
+
+    def random_intersection(self):
+        """Same as random.choice(self.intersections.keys()), without building the key list."""
+        return self.intersection(int(random.random() * len(self.intersections)))
+
+    @property
+    def roads(self):
+        """Roads as (a, b) pairs of intersections, built on first use."""
+        if self._roads is None:
+            self._roads = [(self.intersection(a), self.intersection(b))
+                           for a, b in zip(self.road_from.tolist(), self.road_to.tolist())]
+        return self._roads
+
     def create_agent(self, agent_class, *args, **kwargs):
         agent = agent_class(self, *args, **kwargs)
-        self.agent_states[agent] = {'location': random.choice(self.intersections.keys()), 'heading': (0, 1)}
+        self.agent_order[agent] = len(self.agent_order)
+        self.agent_states[agent] = {'location': None, 'heading': (0, 1)}
+        self.move_agent(agent, self.random_intersection())
         return agent
 
+    def move_agent(self, agent, location):
+        """Set an agent's location, keeping the occupancy index up to date."""
+        state = self.agent_states[agent]
+        entry = (self.agent_order[agent], agent)
+        if state['location'] is not None:
+            self.invalidate_sense(state['location'])
+            self.occupants[state['location']].remove(entry)
+        self.invalidate_sense(location)
+        bisect.insort(self.occupants[location], entry)  # keep creation order, as sense relies on it
+        state['location'] = location
+
+    def invalidate_sense(self, location):
+        """Drop cached inputs of every agent at an intersection."""
+        for _, agent in self.occupants[location]:
+            self.sense_cache.pop(agent, None)
+
     def set_primary_agent(self, agent, enforce_deadline=False):
         self.primary_agent = agent
         self.enforce_deadline = enforce_deadline
 
+    def use_scenarios(self, scenarios):
+        """Replay the trials of a scenario_bank.ScenarioBank, from its first one, on every reset."""
+        if tuple(scenarios.grid_size) != self.grid_size:
+            raise ValueError("Scenario bank grid {} does not match environment grid {}".format(scenarios.grid_size, self.grid_size))
+        self.scenarios = scenarios
+        self.scenario_index = 0
+
+    def load_scenario(self):
+        """
+        Set the traffic lights from the next scenario of the bank and return
+        its start, heading, destination, deadline and dummy placements.
+        """
+        record = self.scenarios[self.scenario_index % len(self.scenarios)]
+        self.scenario_index += 1
+        for traffic_light, state, period in zip(self.intersections.itervalues(), record['light_state'].ravel().tolist(), record['light_period'].ravel().tolist()):
+            traffic_light.initial_state = state
+            traffic_light.period = period
+        placements = [(tuple(location), self.valid_headings[heading]) for location, heading in zip(record['dummy_location'].tolist(), record['dummy_heading'].tolist())]
+        return tuple(record['start'].tolist()), self.valid_headings[record['heading']], tuple(record['destination'].tolist()), int(record['deadline']), placements
+
     def reset(self):
         self.done = False
         self.t = 0
+        self.sense_cache.clear()
 
-        # Reset traffic lights
-        for traffic_light in self.intersections.itervalues():
-            traffic_light.reset()
-
-        # Pick a start and a destination
-        start = random.choice(self.intersections.keys())
-        destination = random.choice(self.intersections.keys())
-
-        # Ensure starting location and destination are not too close
-        while self.compute_dist(start, destination) < 4:
-            start = random.choice(self.intersections.keys())
-            destination = random.choice(self.intersections.keys())
-
-        start_heading = random.choice(self.valid_headings)
-        deadline = self.compute_dist(start, destination) * 5
+        if self.scenarios is not None:
+            # Replay the next pre-generated trial (lights included)
+            start, start_heading, destination, deadline, placements = self.load_scenario()
+            n_others = len(self.agent_states) - (self.primary_agent is not None) + (self.traffic.n if self.traffic is not None else 0)
+            assert n_others <= len(placements), "Scenario bank has too few dummies!"
+        else:
+            # Reset traffic lights (they carry on from their current state)
+            for traffic_light in self.intersections.itervalues():
+                traffic_light.reset(self.light_t)
+
+            # Pick a start and a destination
+            start = self.random_intersection()
+            destination = self.random_intersection()
+
+            # Ensure starting location and destination are not too close
+            while self.compute_dist(start, destination) < 4:
+                start = self.random_intersection()
+                destination = self.random_intersection()
+
+            start_heading = random.choice(self.valid_headings)
+            deadline = self.compute_dist(start, destination) * 5
+            placements = None
+        self.light_t = 0
         #print "Environment.reset(): Trial set up with start = {}, destination = {}, deadline = {}".format(start, destination, deadline)
 
-        # Initialize agent(s)
+        # Initialize agent(s) (dummy traffic takes the first placements, other agents the rest)
+        if self.traffic is not None:
+            self.traffic.reset(placements and placements[:self.traffic.n])
+            if placements is not None:
+                placements = placements[self.traffic.n:]
+        others = iter(placements or [])
         for agent in self.agent_states.iterkeys():
+            if agent is self.primary_agent:
+                location, heading = start, start_heading
+            elif placements is not None:
+                location, heading = next(others)
+            else:
+                location, heading = self.random_intersection(), random.choice(self.valid_headings)
             self.agent_states[agent] = {
-                'location': start if agent is self.primary_agent else random.choice(self.intersections.keys()),
-                'heading': start_heading if agent is self.primary_agent else random.choice(self.valid_headings),
+                'location': self.agent_states[agent]['location'],
+                'heading': heading,
                 'destination': destination if agent is self.primary_agent else None,
                 'deadline': deadline if agent is self.primary_agent else None}
+            self.move_agent(agent, location)
             agent.reset(destination=(destination if agent is self.primary_agent else None))
             if agent is self.primary_agent:
                 # Reset metrics for this trial (step data will be set during the step)
@@ -130,10 +243,11 @@ class Environment(object):
         #print "Environment.step(): t = {}".format(self.t)  # [debug]
 
         # Update traffic lights
-        for intersection, traffic_light in self.intersections.iteritems():
-            traffic_light.update(self.t)
+        self.update_lights()
 
-        # Update agents
+        # Update agents (dummy traffic first, as it would have been created first)
+        if self.traffic is not None:
+            self.traffic.update(self.t)
         for agent in self.agent_states.iterkeys():
             agent.update(self.t)
 
@@ -152,33 +266,60 @@ class Environment(object):
 
         self.t += 1
 
+    def update_lights(self):
+        """Move the lights to the current time (only the ones agents see can invalidate anything)."""
+        self.light_t = self.t
+        for agent in self.sense_cache.keys():
+            location = self.agent_states[agent]['location']
+            if self.intersections[location].switches(self.t):
+                self.invalidate_sense(location)
+
     def sense(self, agent):
         assert agent in self.agent_states, "Unknown agent!"
 
+        inputs = self.sense_cache.get(agent)
+        if inputs is not None:
+            return inputs
+
         state = self.agent_states[agent]
         location = state['location']
         heading = state['heading']
-        light = 'green' if (self.intersections[location].state and heading[1] != 0) or ((not self.intersections[location].state) and heading[0] != 0) else 'red'
+        ns_open = self.light_state(location)
+        light = 'green' if (ns_open and heading[1] != 0) or ((not ns_open) and heading[0] != 0) else 'red'
 
-        # Populate oncoming, left, right
+        # Populate oncoming, left, right (only cars at the same intersection matter)
         oncoming = None
         left = None
         right = None
-        for other_agent, other_state in self.agent_states.iteritems():
-            if agent == other_agent or location != other_state['location'] or (heading[0] == other_state['heading'][0] and heading[1] == other_state['heading'][1]):
+        for other_agent_heading, other_heading in self.cars_at(location, agent):
+            if heading[0] == other_agent_heading[0] and heading[1] == other_agent_heading[1]:
                 continue
-            other_heading = other_agent.get_next_waypoint()
-            if (heading[0] * other_state['heading'][0] + heading[1] * other_state['heading'][1]) == -1:
+            if (heading[0] * other_agent_heading[0] + heading[1] * other_agent_heading[1]) == -1:
                 if oncoming != 'left':  # we don't want to override oncoming == 'left'
                     oncoming = other_heading
-            elif (heading[1] == other_state['heading'][0] and -heading[0] == other_state['heading'][1]):
+            elif (heading[1] == other_agent_heading[0] and -heading[0] == other_agent_heading[1]):
                 if right != 'forward' and right != 'left':  # we don't want to override right == 'forward or 'left'
                     right = other_heading
             else:
                 if left != 'forward':  # we don't want to override left == 'forward'
                     left = other_heading
 
-        return {'light': light, 'oncoming': oncoming, 'left': left, 'right': right}
+        inputs = {'light': light, 'oncoming': oncoming, 'left': left, 'right': right}
+        self.sense_cache[agent] = inputs
+        return inputs
+
+    def cars_at(self, location, agent=None):
+        """Yields (heading, next waypoint) of every car at location but agent, in creation order."""
+        if self.traffic is not None:
+            for car in self.traffic.cars_at(location):
+                yield car
+        for _, other_agent in self.occupants[location]:
+            if other_agent is not agent:
+                yield self.agent_states[other_agent]['heading'], other_agent.get_next_waypoint()
+
+    def light_state(self, location):
+        """State of the traffic light at an intersection (True = NS open)."""
+        return self.intersections[location].state_at(self.light_t)
 
     def get_deadline(self, agent):
         return self.agent_states[agent]['deadline'] if agent is self.primary_agent else None
@@ -190,8 +331,11 @@ class Environment(object):
         state = self.agent_states[agent]
         location = state['location']
         heading = state['heading']
-        light = 'green' if (self.intersections[location].state and heading[1] != 0) or ((not self.intersections[location].state) and heading[0] != 0) else 'red'
-        inputs = self.sense(agent)
+        position = location, heading  # before moving
+        inputs = self.sense(agent)  # normally cached from the agent's own update
+        light = inputs['light']
+        # the agent may have changed its waypoint, which cars around it sense
+        self.invalidate_sense(location)
 
         # Move agent if within bounds and obeys traffic rules
         reward = 0  # reward/penalty
@@ -217,7 +361,7 @@ class Environment(object):
                 location = ((location[0] + heading[0] - self.bounds[0]) % (self.bounds[2] - self.bounds[0] + 1) + self.bounds[0],
                             (location[1] + heading[1] - self.bounds[1]) % (self.bounds[3] - self.bounds[1] + 1) + self.bounds[1])  # wrap-around
                 #if self.bounds[0] <= location[0] <= self.bounds[2] and self.bounds[1] <= location[1] <= self.bounds[3]:  # bounded
-                state['location'] = location
+                self.move_agent(agent, location)
                 state['heading'] = heading
                 reward = 2.0 if action == agent.get_next_waypoint() else -0.5  # valid, but is it correct? (as per waypoint)
             else:
@@ -237,8 +381,10 @@ class Environment(object):
                     self.primary_agent.sum_time_left += state['deadline']
                     self.trial_data['success'] = 1
                 self.done = True
-                print "Environment.act(): Primary agent has reached destination!"  # [debug]
-            self.status_text = "state: {}\naction: {}\nreward: {}".format(agent.get_state(), action, reward)
+                if self.verbose:
+                    print "Environment.act(): Primary agent has reached destination!"  # [debug]
+            if self.verbose:
+                self.status_text = "state: {}\naction: {}\nreward: {}".format(agent.get_state(), action, reward)
             #print "Environment.act() [POST]: location: {}, heading: {}, action: {}, reward: {}".format(location, heading, action, reward)  # [debug]
 
             # Update metrics
@@ -248,6 +394,8 @@ class Environment(object):
             self.step_data['inputs'] = inputs
             self.step_data['action'] = action
             self.step_data['reward'] = reward
+            self.step_data['location'] = position[0]
+            self.step_data['heading'] = position[1]
             self.trial_data['net_reward'] += reward
             # print "Environment.act(): Step data: {}".format(self.step_data)  # [debug]
 
@@ -309,3 +457,124 @@ class DummyAgent(Agent):
         reward = self.env.act(self, action)
         #print "DummyAgent.update(): t = {}, inputs = {}, action = {}, reward = {}".format(t, inputs, action, reward)  # [debug]
         #print "DummyAgent.update(): next_waypoint = {}".format(self.next_waypoint)  # [debug]
+
+
+class DummyTraffic(object):
+    """
+    Dummy agents kept as arrays (location, heading, next waypoint) and
+    updated together.
+
+    Every dummy senses the intersection as it was at the start of the step,
+    follows the same rules as DummyAgent and all of them move at once.
+    Other agents sense them exactly as they would sense DummyAgents.
+    """
+
+    headings = np.array(Environment.valid_headings)
+    # heading indices after turning left/right (see Environment.act)
+    left_turn = np.array([Environment.valid_headings.index((h[1], -h[0])) for h in Environment.valid_headings])
+    right_turn = np.array([Environment.valid_headings.index((-h[1], h[0])) for h in Environment.valid_headings])
+    opposite = np.array([Environment.valid_headings.index((-h[0], -h[1])) for h in Environment.valid_headings])
+    NONE, FORWARD, LEFT, RIGHT = range(len(Environment.valid_actions))  # action codes
+
+    def __init__(self, env, n):
+        self.env = env
+        self.n = n
+        self.origin = np.array(env.bounds[:2])
+        self.span = np.array(env.grid_size)
+        self.location = self.origin + (np.random.rand(n, 2) * self.span).astype(int)
+        self.heading = np.zeros(n, dtype=int) + Environment.valid_headings.index((0, 1))
+        self.waypoint = np.random.randint(self.FORWARD, self.RIGHT + 1, size=n)
+        self.update_nodes()
+        self.update_lights()
+
+    def reset(self, placements=None):
+        """Place the dummies at random, or at the given (location, heading) pairs."""
+        if placements is not None:
+            self.location = np.array([location for location, _ in placements], dtype=int).reshape(self.n, 2)
+            self.heading = np.array([Environment.valid_headings.index(heading) for _, heading in placements], dtype=int)
+        else:
+            self.location = self.origin + (np.random.rand(self.n, 2) * self.span).astype(int)
+            self.heading = np.random.randint(len(self.headings), size=self.n)
+        self.update_nodes()
+        self.update_lights()
+
+    def update_lights(self):
+        """Copy the cycle of every traffic light (in env.intersections order), for evaluating them at once."""
+        lights = self.env.intersections.values()
+        self.light_initial = np.array([light.initial_state for light in lights], dtype=bool)
+        self.light_period = np.array([light.period for light in lights])
+
+    def node(self, location):
+        """Intersection indices (as in env.intersections) of an array of locations."""
+        return (location[..., 0] - self.origin[0]) * self.span[1] + location[..., 1] - self.origin[1]
+
+    def update_nodes(self):
+        self.nodes = self.node(self.location)
+
+    def cars_at(self, location):
+        for i in np.flatnonzero(self.nodes == self.node(np.array(location))):
+            yield tuple(self.headings[self.heading[i]]), Environment.valid_actions[self.waypoint[i]]
+
+    def sense(self, nodes, heading, waypoint):
+        """
+        Oncoming, left and right action codes sensed by the first n cars,
+        given every car's intersection, heading index and waypoint code
+        (in creation order), with the precedence rules of Environment.sense.
+        """
+        index = np.arange(len(nodes))
+        groups, group = np.unique(nodes * 4 + heading, return_inverse=True)  # cars at one intersection with one heading
+        last = np.zeros(len(groups), dtype=int)
+        np.maximum.at(last, group, index)
+        any_left = np.zeros(len(groups), dtype=bool)
+        any_left[group[waypoint == self.LEFT]] = True
+        any_forward = np.zeros(len(groups), dtype=bool)
+        any_forward[group[waypoint == self.FORWARD]] = True
+        first_turn = np.zeros(len(groups), dtype=int) + len(nodes)  # first car going forward or left
+        turning = (waypoint == self.FORWARD) | (waypoint == self.LEFT)
+        np.minimum.at(first_turn, group[turning], index[turning])
+        last_waypoint = waypoint[last]
+        # value each group shows as oncoming / right / left traffic
+        as_oncoming = np.where(any_left, self.LEFT, last_waypoint)
+        as_right = np.where(first_turn < len(nodes), waypoint[np.minimum(first_turn, len(nodes) - 1)], last_waypoint)
+        as_left = np.where(any_forward, self.FORWARD, last_waypoint)
+
+        def lookup(other_heading, values):
+            keys = nodes[:self.n] * 4 + other_heading[:self.n]
+            pos = np.minimum(np.searchsorted(groups, keys), len(groups) - 1)
+            return np.where(groups[pos] == keys, values[pos], self.NONE)
+
+        # traffic going the opposite way is oncoming, traffic heading left comes from the right
+        return (lookup(self.opposite[heading], as_oncoming), lookup(self.left_turn[heading], as_right),
+                lookup(self.right_turn[heading], as_left))
+
+    def update(self, t):
+        env = self.env
+        if self.n == 0:
+            return
+
+        # every car: dummies first, then agents
+        agents = [(state['location'], state['heading'], agent.get_next_waypoint()) for agent, state in env.agent_states.iteritems()]
+        nodes = np.concatenate([self.nodes, [self.node(np.array(location)) for location, _, _ in agents]]).astype(int)
+        heading = np.concatenate([self.heading, [Environment.valid_headings.index(h) for _, h, _ in agents]]).astype(int)
+        waypoint = np.concatenate([self.waypoint, [Environment.valid_actions.index(w) for _, _, w in agents]]).astype(int)
+        oncoming, right, left = self.sense(nodes, heading, waypoint)
+
+        # same closed form as TrafficLight.state_at, only for the intersections with dummies
+        ns_open = self.light_initial[self.nodes] != ((env.light_t // self.light_period[self.nodes]) % 2 == 1)
+        hx, hy = self.headings[self.heading].T
+        green = (ns_open & (hy != 0)) | (~ns_open & (hx != 0))
+
+        # same rules as DummyAgent.update
+        move = np.select(
+            [self.waypoint == self.RIGHT, self.waypoint == self.FORWARD, self.waypoint == self.LEFT],
+            [green | (left != self.FORWARD), green,
+             green & (oncoming != self.FORWARD) & (oncoming != self.RIGHT)], False)
+
+        # move all dummies that can go at once (wrap-around)
+        self.heading = np.select([move & (self.waypoint == self.LEFT), move & (self.waypoint == self.RIGHT)],
+                                 [self.left_turn[self.heading], self.right_turn[self.heading]], self.heading)
+        moved = self.origin + (self.location + self.headings[self.heading] - self.origin) % self.span
+        self.location = np.where(move[:, None], moved, self.location)
+        self.waypoint = np.where(move, np.random.randint(self.FORWARD, self.RIGHT + 1, size=self.n), self.waypoint)
+        self.update_nodes()
+        env.sense_cache.clear()
@@ -0,0 +1,84 @@
+import random
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+
+from environment import Environment
+from scenario_bank import ScenarioBank
+from simulator import HeadlessSimulator
+
+result_columns = ['n_dest_reached', 'last_dest_fail', 'sum_time_left',
+                  'n_penalties', 'last_penalty', 'len_qvals']
+
+
+def run_sim(job):
+    """
+    Run one simulation described by job, a tuple
+    (agent, args, kwargs, n_trials, seed, planner, scenarios).
+    Both random and numpy.random are seeded with seed,
+    so every simulation is reproducible on its own.
+    With scenarios (the path of a scenario bank), the trials
+    replay the bank from its first scenario.
+    """
+    agent, args, kwargs, n_trials, seed, planner, scenarios = job
+    random.seed(seed)
+    np.random.seed(seed)
+
+    e = Environment()  # create environment (also adds some dummy traffic)
+    if scenarios is not None:
+        e.use_scenarios(ScenarioBank(scenarios))
+    a = e.create_agent(agent, *args, **kwargs)  # create agent
+    if planner is not None:
+        a.planner = planner(e, a)
+    e.set_primary_agent(a, enforce_deadline=True)  # specify agent to track
+
+    sim = HeadlessSimulator(e)
+    return sim.run(n_trials=n_trials)
+
+
+def run_sims(agent, n_sims, n_trials, args=(), kwargs=None, planner=None,
+             seed=None, processes=None, cache=None, scenarios=None):
+    """
+    Run n_sims independent simulations of n_trials each with the agent
+    (created as agent(env, *args, **kwargs)), spread over a pool of
+    processes (default: one per CPU; processes=1 runs them in this process).
+    Simulation i is seeded with seed + i; a random base seed is drawn
+    when seed is None. With scenarios (the path of a scenario bank, see
+    scenario_bank.generate), every simulation plays the same trials.
+    With a result_cache.ResultCache, simulations already in the cache are
+    loaded instead of run, and new results are added to it.
+    Returns the results as a dataframe, one row per simulation.
+    """
+    if seed is None:
+        seed = random.randint(0, 2 ** 31 - 1)
+    jobs = [(agent, tuple(args), kwargs or {}, n_trials, seed + i, planner,
+             scenarios)
+            for i in range(n_sims)]
+
+    results = [None] * n_sims
+    if cache is not None:
+        keys = [cache.key(*job) for job in jobs]
+        results = [cache.get(key) for key in keys]
+    missing = [i for i in range(n_sims) if results[i] is None]
+
+    pool = None
+    if processes != 1 and len(missing) > 1:
+        pool = multiprocessing.Pool(processes)
+        # results come back in order as soon as each simulation ends
+        new_results = pool.imap(run_sim, [jobs[i] for i in missing])
+    else:
+        new_results = (run_sim(jobs[i]) for i in missing)
+    try:
+        for i, result in zip(missing, new_results):
+            results[i] = result
+            if cache is not None:
+                cache.put(keys[i], result)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    df_results = pd.DataFrame(results)
+    df_results.columns = result_columns
+    return df_results
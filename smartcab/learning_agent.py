@@ -1,4 +1,3 @@
-import random
 from basic_agent import BasicAgent
 
 class LearningAgent(BasicAgent):
@@ -9,16 +8,7 @@ class LearningAgent(BasicAgent):
         Returns the best action (the one with the maximum Q-value)
         or one of the best actions, given a state.
         """        
-        # get all possible q-values for the state
-        all_qvals = {action: self.qvals.get((state, action), 0)
-                     for action in self.possible_actions}        
-        
-        # pick the actions that yield the largest q-value for the state
-        best_actions = [action for action in self.possible_actions 
-                        if all_qvals[action] == max(all_qvals.values())]
-        
-        # return one of the best actions at random
-        return random.choice(best_actions)        
+        return self.qvals.best_action(state)
 
     def update_qvals(self, state, action, reward):
         """
@@ -27,6 +17,4 @@ class LearningAgent(BasicAgent):
         # define the learning rate for the current time
         learn_rate = 1.0 / self.time
         
-        self.qvals[(self.state, action)] = \
-            (1 - learn_rate) * self.qvals.get((self.state, action), 0) + \
-            learn_rate * reward
\ No newline at end of file
+        self.qvals.learn(self.state, action, reward, learn_rate)
\ No newline at end of file
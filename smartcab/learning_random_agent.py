@@ -1,7 +1,7 @@
-import pandas as pd
+import experiment
 import random
 from environment import Environment
-from simulator import Simulator
+from simulator import HeadlessSimulator
 from learning_agent import LearningAgent
 
 class LearningRandomAgent(LearningAgent):
@@ -25,21 +25,15 @@ class LearningRandomAgent(LearningAgent):
         # if random number smaller than random rate, 
         # the agent picks an unexplored action at the current state
         if random.random() < random_rate:
-            unexplored_actions = [action for action in self.possible_actions
-                                  if (state, action) not in self.qvals.keys()]
+            unexplored_actions = self.qvals.unexplored(state)
             if unexplored_actions:
                 actions = unexplored_actions
             else: # if no actions are unexplored in this state, pick any action
                 actions = self.possible_actions
         
         else:
-            # get all possible q-values for the state
-            all_qvals = {action: self.qvals.get((state, action), 0)
-                         for action in self.possible_actions}        
-        
-            # pick the actions that yield the largest q-value for the state
-            actions = [action for action in self.possible_actions 
-                       if all_qvals[action] == max(all_qvals.values())]
+            # pick one of the actions that yield the largest q-value
+            return self.qvals.best_action(state)
         
         # return one of the actions at random
         return random.choice(actions)
@@ -57,29 +51,26 @@ def run_random_change(eps):
     # NOTE: You can set enforce_deadline=False while debugging to allow longer trials
 
     # Now simulate it
-    sim = Simulator(e, update_delay=0, display=False)  # create simulator (uses pygame when display=True, if available)
-    # NOTE: To speed up simulation, reduce update_delay and/or set display=False
+    sim = HeadlessSimulator(e)  # create simulator (no display, pacing or console output)
 
     return sim.run(n_trials=100)  # run for a specified number of trials
-    # NOTE: To quit midway, press Esc or close pygame window, or hit Ctrl+C on the command-line
 
-def several_random_changes(epses, folder):
+def several_random_changes(epses, folder, seed=None, processes=None,
+                           cache=None):
     """
     For each eps value in epses, runs a simulation
     with a LearningRandomAgent.
     Returns a dict with dataframe results for the agent
     for each eps value.
+    Simulations run in parallel (see experiment.run_sims);
+    with a fixed seed, a result_cache.ResultCache skips the
+    simulations that were already run.
     """
     results = {}
     for eps in epses:
-        eps_results = []
-        for i in range(100):
-            sim_results = run_random_change(eps)
-            eps_results.append(sim_results)
-        df_results = pd.DataFrame(eps_results)
-        df_results.columns = ['n_dest_reached', 'last_dest_fail', 
-                              'sum_time_left', 'n_penalties',
-                              'last_penalty', 'len_qvals']
+        df_results = experiment.run_sims(LearningRandomAgent, 100, 100,
+                                         args=(eps,), seed=seed,
+                                         processes=processes, cache=cache)
         df_results.to_csv("{}/random_rate_{}_results.csv".format(folder, eps))
         results[eps] = df_results
     return results
\ No newline at end of file
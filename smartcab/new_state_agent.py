@@ -1,8 +1,16 @@
+from environment import Environment
 from learning_agent import LearningAgent
+from qtable import QTable
 
 class NewStateAgent(LearningAgent):
     """An agent that learns to drive in the smartcab world."""
 
+    def __init__(self, env):
+        super(NewStateAgent, self).__init__(env)
+        # states are (ok_forward, ok_right, ok_left, waypoint)
+        self.qvals = QTable(state_values=((True, False), (True, False), (True, False),
+                                          Environment.valid_actions))
+
     def update(self, t):
         # Gather inputs
         self.next_waypoint = self.planner.next_waypoint()  # from route planner, also displayed by simulator
@@ -20,6 +28,7 @@ class NewStateAgent(LearningAgent):
         
         # Update state
         self.state = (ok_forward, ok_right, ok_left, self.next_waypoint)
+        self.visit(self.state)
 
         # Pick the best known action
         action = self.best_action(self.state)
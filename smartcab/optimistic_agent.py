@@ -1,4 +1,3 @@
-import random
 from learning_agent import LearningAgent
 
 class OptimisticAgent(LearningAgent):
@@ -10,16 +9,8 @@ class OptimisticAgent(LearningAgent):
         or one of the best actions, given a state, being
         optimistic in the face of uncertainty.
         """        
-        # get all possible q-values for the state
+        # unexplored actions count as very good
         # (be optimistic in the face of uncertainty)
-        all_qvals = {action: self.qvals.get((state, action), 100)
-                     for action in self.possible_actions}        
-    
-        # pick the actions that yield the largest q-value for the state
-        best_actions = [action for action in self.possible_actions 
-                        if all_qvals[action] == max(all_qvals.values())]
-    
-        # return one of the best actions at random
-        return random.choice(best_actions)
+        return self.qvals.best_action(state, default=100)
 
         # print "LearningAgent.update(): deadline = {}, inputs = {}, action = {}, reward = {}".format(deadline, inputs, action, reward)  # [debug]
\ No newline at end of file
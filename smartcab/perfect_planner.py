@@ -1,33 +1,37 @@
-import random
+import numpy as np
 
-class RoutePlanner(object):
-    """Silly route planner that is meant for a perpendicular grid network."""
+import planner
 
-    def __init__(self, env, agent):
-        self.env = env
-        self.agent = agent
-        self.destination = None
+class RoutePlanner(planner.RoutePlanner):
+    """Route planner that takes the wrap-around of the grid into account."""
 
-    def route_to(self, destination=None):
-        self.destination = destination if destination is not None else random.choice(self.env.intersections.keys())
-        #print "RoutePlanner.route_to(): destination = {}".format(destination)  # [debug]
+    # plans are encoded as (waypoint code, delta x, delta y); deltas reach
+    # half the grid size, too much for int8 on big grids
+    table_dtype = np.int16
+    plan_shape = (3,)
 
-    def get_delta(self):
+    def next_waypoint(self):
+        """
+        Calculate the next waypoint
+        (and keep the delta from the destination).
+        """
+        waypoint, self.delta = self.plan()
+        return waypoint
+
+    def get_delta(self, location, heading, destination):
         """
         get the horizontal and vertical distance
         between location and destination.
         """
-        location = self.env.agent_states[self.agent]['location']
         grid_size = self.env.grid_size
-        heading = self.env.agent_states[self.agent]['heading']
         delta = [0, 0]
         for i in range(2):
             # 1st option: destination to the east/south of location
-            if self.destination[i] > location[i]:
+            if destination[i] > location[i]:
                 # two possible distances, going east/south or
                 # going west/north
-                possible_delta = [self.destination[i] - location[i], 
-                                  location[i] + grid_size[i] - self.destination[i]]
+                possible_delta = [destination[i] - location[i], 
+                                  location[i] + grid_size[i] - destination[i]]
                 # if both are the same, check the heading
                 if possible_delta[0] == possible_delta[1]:
                     # if agent is turned toward this axis,
@@ -52,7 +56,7 @@ class RoutePlanner(object):
             else:
                 # two possible distances, going west/north or
                 # going east/south
-                possible_delta = [location[i]-self.destination[i], self.destination[i] + grid_size[i] - location[i]]
+                possible_delta = [location[i]-destination[i], destination[i] + grid_size[i] - location[i]]
                 # if both are the same, check the heading                
                 if possible_delta[0] == possible_delta[1]:
                     # if agent is turned toward this axis,
@@ -75,17 +79,24 @@ class RoutePlanner(object):
         # return a tuple
         return tuple(delta)
 
-    def next_waypoint(self):
+    def encode_plan(self, plan):
+        waypoint, delta = plan
+        return planner.waypoint_codes[waypoint], delta[0], delta[1]
+
+    def decode_plan(self, code):
+        return planner.waypoints[code[0]], (int(code[1]), int(code[2]))
+
+    def compute_plan(self, location, heading, destination):
         """
-        Calculate the next waypoint.
+        Calculate the next waypoint and the delta from destination.
         """
-        # get delta from destination
-        self.delta = self.get_delta()
-        delta = self.delta
+        delta = self.get_delta(location, heading, destination)
+        return self.get_waypoint(delta, heading), delta
 
-        # get agent heading        
-        heading = self.env.agent_states[self.agent]['heading']
-        
+    def get_waypoint(self, delta, heading):
+        """
+        Calculate the next waypoint given the delta from destination.
+        """
         # if agent is turned to the east/west axis
         if heading[0]:
             # if it needs to go forward, do it
@@ -1,21 +1,83 @@
 import random
+from collections import OrderedDict
+
+import numpy as np
+
+waypoints = [None, 'forward', 'left', 'right']  # waypoint codes in the tables
+waypoint_codes = {waypoint: i for i, waypoint in enumerate(waypoints)}
+
+# waypoint tables shared by every planner in the process, least recently used first:
+# (planner class, grid bounds, destination) -> plans indexed by (x, y, heading)
+waypoint_tables = OrderedDict()
+max_tables = 256  # tables kept in waypoint_tables
+max_table_intersections = 1024  # planners use tables by default on grids up to this size
 
 class RoutePlanner(object):
     """Silly route planner that is meant for a perpendicular grid network."""
 
-    def __init__(self, env, agent):
+    table_dtype = np.int8  # type and shape of an encoded plan
+    plan_shape = ()
+
+    def __init__(self, env, agent, use_table=None):
         self.env = env
         self.agent = agent
         self.destination = None
+        if use_table is None:
+            use_table = env.grid_size[0] * env.grid_size[1] <= max_table_intersections
+        self.use_table = use_table  # look plans up in a shared table instead of computing them
+        self.plans = None
+        self.heading_codes = {heading: i for i, heading in enumerate(env.valid_headings)}
 
     def route_to(self, destination=None):
-        self.destination = destination if destination is not None else random.choice(self.env.intersections.keys())
+        self.destination = destination if destination is not None else self.env.random_intersection()
+        if self.use_table:
+            self.plans = self.waypoint_table(self.destination)
         #print "RoutePlanner.route_to(): destination = {}".format(destination)  # [debug]
 
+    def waypoint_table(self, destination):
+        """
+        Plans towards destination for every (location, heading) on the grid,
+        encoded by encode_plan in an array indexed by (x, y, heading code),
+        x and y counted from the grid origin. Tables are shared by all
+        planners of this class on the same grid; the max_tables most
+        recently used are kept.
+        """
+        key = (self.__class__, self.env.bounds, destination)
+        table = waypoint_tables.pop(key, None)
+        if table is None:
+            x0, y0 = self.env.bounds[:2]
+            table = np.zeros(tuple(self.env.grid_size) + (len(self.env.valid_headings),) + self.plan_shape,
+                             dtype=self.table_dtype)
+            for location in self.env.intersections:
+                for heading in self.env.valid_headings:
+                    table[location[0] - x0, location[1] - y0, self.heading_codes[heading]] = \
+                        self.encode_plan(self.compute_plan(location, heading, destination))
+            if len(waypoint_tables) >= max_tables:
+                waypoint_tables.popitem(last=False)
+        waypoint_tables[key] = table
+        return table
+
+    def encode_plan(self, plan):
+        return waypoint_codes[plan]
+
+    def decode_plan(self, code):
+        return waypoints[code]
+
+    def plan(self):
+        """Plan for the agent's current location and heading."""
+        state = self.env.agent_states[self.agent]
+        if self.use_table:
+            location = state['location']
+            return self.decode_plan(self.plans[location[0] - self.env.bounds[0], location[1] - self.env.bounds[1],
+                                               self.heading_codes[state['heading']]])
+        return self.compute_plan(state['location'], state['heading'], self.destination)
+
     def next_waypoint(self):
-        location = self.env.agent_states[self.agent]['location']
-        heading = self.env.agent_states[self.agent]['heading']
-        delta = (self.destination[0] - location[0], self.destination[1] - location[1])
+        return self.plan()
+
+    def compute_plan(self, location, heading, destination):
+        """Next waypoint from location and heading towards destination."""
+        delta = (destination[0] - location[0], destination[1] - location[1])
         if delta[0] == 0 and delta[1] == 0:
             return None
         elif delta[0] != 0:  # EW difference
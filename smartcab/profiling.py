@@ -0,0 +1,137 @@
+import random
+import timeit
+import contextlib
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+from environment import Environment, DummyAgent
+from simulator import HeadlessSimulator
+
+
+class Profiler(object):
+    """
+    Cumulative time and call counts per phase of the simulation loop.
+
+    instrumented(sim) is a context in which the methods behind each phase
+    are wrapped on the classes of the simulator's objects (light updates,
+    dummy traffic, sensing, the planner, the learner's best_action and
+    update_qvals, act, the rest of the agent update, the reporter); the
+    original methods are restored on exit. Instances are left untouched, so
+    they can be copied or pickled while instrumented. Nothing is wrapped,
+    and nothing costs anything, outside the context.
+
+    Phases nest (act senses, the agent update plans and acts), so each
+    phase gets both its total time and its own time, excluding the phases
+    inside it.
+    """
+
+    def __init__(self):
+        self.calls = defaultdict(int)
+        self.total = defaultdict(float)
+        self.own = defaultdict(float)
+        self.inner = []  # time spent in nested phases, per open phase
+        self.wrapped = []  # (class, method name, own attribute or None) to restore
+
+    def wrap(self, obj, name, phase):
+        """Time every call of obj.name as phase (on obj's class, so for all its instances)."""
+        cls = type(obj)
+        if any(wrapped[:2] == (cls, name) for wrapped in self.wrapped):
+            return
+        method = getattr(cls, name)
+        clock = timeit.default_timer
+
+        def timed(*args, **kwargs):
+            start = clock()
+            self.inner.append(0.0)
+            try:
+                return method(*args, **kwargs)
+            finally:
+                elapsed = clock() - start
+                self.calls[phase] += 1
+                self.total[phase] += elapsed
+                self.own[phase] += elapsed - self.inner.pop()
+                if self.inner:
+                    self.inner[-1] += elapsed
+
+        self.wrapped.append((cls, name, cls.__dict__.get(name)))
+        setattr(cls, name, timed)
+
+    def instrument(self, sim):
+        env = sim.env
+        self.wrap(sim, 'collect_metrics', 'reporter')
+        if sim.display:
+            self.wrap(sim, 'render', 'render')
+        self.wrap(env, 'step', 'step')
+        self.wrap(env, 'update_lights', 'lights')
+        self.wrap(env, 'sense', 'sense')
+        self.wrap(env, 'act', 'act')
+        if env.traffic is not None:
+            self.wrap(env.traffic, 'update', 'dummies')
+        for agent in env.agent_states:
+            if isinstance(agent, DummyAgent):
+                self.wrap(agent, 'update', 'dummies')
+        agent = env.primary_agent
+        self.wrap(agent, 'update', 'agent')
+        for name, phase in [('best_action', 'best_action'), ('update_qvals', 'update_qvals')]:
+            if hasattr(agent, name):
+                self.wrap(agent, name, phase)
+        if getattr(agent, 'planner', None) is not None:
+            self.wrap(agent.planner, 'next_waypoint', 'planner')
+
+    def restore(self):
+        for cls, name, original in reversed(self.wrapped):
+            if original is None:
+                delattr(cls, name)  # the method was inherited
+            else:
+                setattr(cls, name, original)
+        self.wrapped = []
+
+    @contextlib.contextmanager
+    def instrumented(self, sim):
+        self.instrument(sim)
+        try:
+            yield self
+        finally:
+            self.restore()
+
+    def run(self, sim, n_trials=1):
+        """Run the simulator instrumented; return its results."""
+        with self.instrumented(sim):
+            return sim.run(n_trials)
+
+    def table(self):
+        """Breakdown per phase, by decreasing own time."""
+        df = pd.DataFrame({'calls': pd.Series(self.calls), 'total': pd.Series(self.total),
+                           'own': pd.Series(self.own)}, columns=['calls', 'total', 'own'])
+        df['own_share'] = df['own'] / df['own'].sum()
+        df['us_per_call'] = df['own'] / df['calls'] * 1e6
+        return df.sort_values('own', ascending=False)
+
+
+def run(agent, n_trials, args=(), kwargs=None, seed=None, profiler=None):
+    """Results of a seeded headless run of the agent, profiled by profiler if given."""
+    random.seed(seed)
+    np.random.seed(seed)
+    e = Environment()
+    a = e.create_agent(agent, *args, **(kwargs or {}))
+    e.set_primary_agent(a, enforce_deadline=True)
+    sim = HeadlessSimulator(e)
+    return sim.run(n_trials) if profiler is None else profiler.run(sim, n_trials)
+
+
+def profile(agent, n_trials=100, args=(), kwargs=None, seed=0, check=False):
+    """
+    Per-phase breakdown of a headless run of n_trials with the agent
+    (created as agent(env, *args, **kwargs)), as Profiler.table returns it.
+    With check and a seed, the run is repeated unprofiled (doubling the
+    cost), and profiling must not have changed its results.
+    """
+    profiler = Profiler()
+    results = run(agent, n_trials, args, kwargs, seed, profiler)
+    if check and seed is not None:
+        expected = run(agent, n_trials, args, kwargs, seed)
+        if results != expected:
+            raise RuntimeError("profile(): Profiled results {} differ from unprofiled results {}".format(results, expected))
+    return profiler.table()
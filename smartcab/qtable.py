@@ -0,0 +1,109 @@
+import random
+import itertools
+
+import numpy as np
+
+from environment import Environment
+
+
+class QTable(object):
+    """
+    Tabular Q-values and exploration statistics over a small, finite
+    state space.
+
+    States (tuples with one value per component, each taken from
+    state_values) and actions are encoded as integers. Preallocated NumPy
+    arrays hold, per (state, action), the Q-value and number of updates and,
+    per state, the number of visits, a bitmask of the actions tried and the
+    step of the last update. The table also behaves like the
+    {(state, action): q-value} dict the agents used to keep, holding only
+    the pairs that have been written.
+    """
+
+    default_state_values = (('red', 'green'), Environment.valid_actions,
+                            Environment.valid_actions, Environment.valid_actions)
+
+    def __init__(self, state_values=default_state_values, actions=Environment.valid_actions):
+        self.state_values = state_values
+        self.states = list(itertools.product(*state_values))
+        self.state_index = {state: i for i, state in enumerate(self.states)}
+        self.actions = list(actions)
+        self.action_index = {action: i for i, action in enumerate(self.actions)}
+        self.values = np.zeros((len(self.states), len(self.actions)))
+        self.visits = np.zeros((len(self.states), len(self.actions)), dtype=int)  # updates of each pair
+        self.state_visits = np.zeros(len(self.states), dtype=int)
+        self.tried = np.zeros(len(self.states), dtype=int)  # bit a set once action a was updated
+        self.last_update = np.zeros(len(self.states), dtype=int)
+        self.n_updates = 0
+        # untried actions for every possible bitmask
+        self.untried_actions = [[action for a, action in enumerate(self.actions) if not mask & (1 << a)]
+                                for mask in range(2 ** len(self.actions))]
+
+    def encode(self, key):
+        state, action = key
+        return self.state_index[state], self.action_index[action]
+
+    def best_action(self, state, default=0):
+        """
+        Return one of the actions with the largest Q-value in state,
+        chosen at random; unvisited pairs count as default.
+        """
+        s = self.state_index[state]
+        values = np.where(self.visits[s] > 0, self.values[s], default)
+        best = np.flatnonzero(values == values.max())
+        return self.actions[random.choice(best)]
+
+    def unexplored(self, state):
+        """Return the actions that were never tried in state."""
+        return self.untried_actions[self.tried[self.state_index[state]]]
+
+    def visit(self, state):
+        """Count a visit to state; return the number of visits so far."""
+        s = self.state_index[state]
+        self.state_visits[s] += 1
+        return self.state_visits[s]
+
+    def record(self, s, a, value):
+        self.values[s, a] = value
+        self.visits[s, a] += 1
+        self.tried[s] |= 1 << a
+        self.n_updates += 1
+        self.last_update[s] = self.n_updates
+
+    def learn(self, state, action, reward, learn_rate):
+        """Move the Q-value of (state, action) towards reward."""
+        s, a = self.state_index[state], self.action_index[action]
+        self.record(s, a, (1 - learn_rate) * self.values[s, a] + learn_rate * reward)
+
+    # dict-like view of the visited (state, action) pairs
+
+    def __len__(self):
+        return np.count_nonzero(self.visits)
+
+    def __contains__(self, key):
+        try:
+            s, a = self.encode(key)
+            return bool(self.tried[s] & (1 << a))
+        except (KeyError, TypeError, ValueError):  # not a (state, action) pair of this table
+            return False
+
+    def __getitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        return self.values[self.encode(key)]
+
+    def __setitem__(self, key, value):
+        s, a = self.encode(key)
+        self.record(s, a, value)
+
+    def get(self, key, default=None):
+        return self.values[self.encode(key)] if key in self else default
+
+    def keys(self):
+        return [(self.states[s], self.actions[a]) for s, a in zip(*np.nonzero(self.visits))]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def items(self):
+        return [(key, self.values[self.encode(key)]) for key in self.keys()]
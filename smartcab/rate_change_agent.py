@@ -1,6 +1,6 @@
-import pandas as pd
+import experiment
 from environment import Environment
-from simulator import Simulator
+from simulator import HeadlessSimulator
 from learning_agent import LearningAgent
 
 class RateChangeAgent(LearningAgent):
@@ -20,9 +20,7 @@ class RateChangeAgent(LearningAgent):
         # define the learning rate for the current time
         learn_rate = 1.0 / (1 + self.mult*self.time)
         
-        self.qvals[(self.state, action)] = \
-            (1 - learn_rate) * self.qvals.get((self.state, action), 0) + \
-            learn_rate * reward
+        self.qvals.learn(self.state, action, reward, learn_rate)
 
 def run_rate_change(mult):
     """Run the agent for a finite number of trials."""
@@ -34,29 +32,26 @@ def run_rate_change(mult):
     # NOTE: You can set enforce_deadline=False while debugging to allow longer trials
 
     # Now simulate it
-    sim = Simulator(e, update_delay=0, display=False)  # create simulator (uses pygame when display=True, if available)
-    # NOTE: To speed up simulation, reduce update_delay and/or set display=False
+    sim = HeadlessSimulator(e)  # create simulator (no display, pacing or console output)
 
     return sim.run(n_trials=100)  # run for a specified number of trials
-    # NOTE: To quit midway, press Esc or close pygame window, or hit Ctrl+C on the command-line
 
-def several_rate_changes(mults, folder):
+def several_rate_changes(mults, folder, seed=None, processes=None,
+                         cache=None):
     """
     For each mult value in mults, runs a simulation
     with a RateChangeAgent.
     Returns a dict with dataframe results for the agent
     for each mult value.
+    Simulations run in parallel (see experiment.run_sims);
+    with a fixed seed, a result_cache.ResultCache skips the
+    simulations that were already run.
     """
     results = {}
     for mult in mults:
-        mult_results = []
-        for i in range(100):
-            sim_results = run_rate_change(mult)
-            mult_results.append(sim_results)
-        df_results = pd.DataFrame(mult_results)
-        df_results.columns = ['n_dest_reached', 'last_dest_fail', 
-                              'sum_time_left', 'n_penalties',
-                              'last_penalty', 'len_qvals']
+        df_results = experiment.run_sims(RateChangeAgent, 100, 100,
+                                         args=(mult,), seed=seed,
+                                         processes=processes, cache=cache)
         df_results.to_csv("{}/rate_change_{}_results.csv".format(folder, mult))
         results[mult] = df_results
     return results
\ No newline at end of file
@@ -0,0 +1,90 @@
+import os
+import glob
+import json
+import hashlib
+
+source_dir = os.path.dirname(os.path.abspath(__file__))
+_source_hash = None
+
+
+def source_hash():
+    """SHA-1 of every smartcab source file (computed once per process)."""
+    global _source_hash
+    if _source_hash is None:
+        sha = hashlib.sha1()
+        for path in sorted(glob.glob(os.path.join(source_dir, '*.py'))):
+            sha.update(os.path.basename(path))
+            with open(path, 'rb') as f:
+                sha.update(f.read())
+        _source_hash = sha.hexdigest()
+    return _source_hash
+
+
+class ResultCache(object):
+    """
+    On-disk cache of simulation results, one small JSON file per simulation.
+
+    Entries are addressed by a hash of the agent class, its constructor
+    arguments, the planner, n_trials, the seed, the scenario bank file (if
+    any) and the smartcab sources, so any code change invalidates them. When the cache grows past
+    max_size bytes, the least recently used entries are removed.
+    """
+
+    def __init__(self, folder, max_size=100 * 2 ** 20):
+        self.folder = folder
+        self.max_size = max_size
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        self.size = sum(os.path.getsize(path) for path in self.entries())
+
+    def entries(self):
+        return glob.glob(os.path.join(self.folder, '*.json'))
+
+    def key(self, agent, args, kwargs, n_trials, seed, planner=None, scenarios=None):
+        description = repr((agent.__module__, agent.__name__, tuple(args),
+                            sorted(kwargs.items()),
+                            planner and (planner.__module__, planner.__name__),
+                            n_trials, seed, source_hash(),
+                            scenarios and (os.path.abspath(scenarios), os.path.getsize(scenarios),
+                                           os.path.getmtime(scenarios))))
+        return hashlib.sha1(description).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.folder, key + '.json')
+
+    def get(self, key):
+        """Return the cached result for key, or None."""
+        path = self.path(key)
+        try:
+            with open(path) as f:
+                result = tuple(json.load(f))
+        except (IOError, ValueError):
+            return None
+        os.utime(path, None)  # mark as recently used
+        return result
+
+    def put(self, key, result):
+        path = self.path(key)
+        if os.path.exists(path):
+            self.size -= os.path.getsize(path)
+        with open(path, 'w') as f:
+            json.dump(list(result), f)
+        self.size += os.path.getsize(path)
+        if self.size > self.max_size:
+            self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_size."""
+        entries = [(os.path.getmtime(path), os.path.getsize(path), path)
+                   for path in self.entries()]
+        self.size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if self.size <= self.max_size:
+                break
+            os.remove(path)
+            self.size -= size
+
+    def clear(self):
+        for path in self.entries():
+            os.remove(path)
+        self.size = 0
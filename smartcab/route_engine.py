@@ -0,0 +1,101 @@
+import heapq
+
+import planner
+from environment import Environment
+
+# waypoint to take given (heading, direction of the next intersection)
+turns = {}
+for heading in Environment.valid_headings:
+    turns[(heading, heading)] = 'forward'
+    turns[(heading, (heading[1], -heading[0]))] = 'left'
+    turns[(heading, (-heading[1], heading[0]))] = 'right'
+    turns[(heading, (-heading[0], -heading[1]))] = 'right'  # long U-turn
+
+
+class RouteEngine(object):
+    """
+    Shortest paths over a road network.
+
+    The network is a set of directed, weighted roads (by default the roads
+    of an Environment, all with weight 1). For each destination, a
+    Dijkstra search over the reversed roads gives every intersection's
+    distance to it and the next intersection on a shortest path. These
+    rows are computed on demand and cached; adding or removing a road
+    only drops the rows it can change.
+    """
+
+    def __init__(self, roads=(), weights=None):
+        self.weights = {}  # (a, b) -> weight of the road from a to b
+        self.incoming = {}  # b -> {a: weight} for every road a -> b
+        self.rows = {}  # destination -> (distances, next hops)
+        weights = weights or {}
+        for a, b in roads:
+            self.add_road(a, b, weights.get((a, b), 1))
+
+    @classmethod
+    def of(cls, env):
+        """Route engine of an environment, built from its roads on first use."""
+        if env.route_engine is None:
+            env.route_engine = cls(env.roads)
+        return env.route_engine
+
+    def add_road(self, a, b, weight=1):
+        """Add (or re-weight) the road from a to b."""
+        self.weights[(a, b)] = weight
+        self.incoming.setdefault(b, {})[a] = weight
+        self.incoming.setdefault(a, {})
+        # only rows where the road is a shortcut for a change
+        for destination, (distances, next_hops) in self.rows.items():
+            if distances.get(b, float('inf')) + weight < distances.get(a, float('inf')) or next_hops.get(a) == b:
+                del self.rows[destination]
+
+    def remove_road(self, a, b):
+        """Remove the road from a to b."""
+        del self.weights[(a, b)]
+        del self.incoming[b][a]
+        # only rows whose shortest paths used the road change
+        for destination, (distances, next_hops) in self.rows.items():
+            if next_hops.get(a) == b:
+                del self.rows[destination]
+
+    def row(self, destination):
+        if destination not in self.rows:
+            self.rows[destination] = self.shortest_paths(destination)
+        return self.rows[destination]
+
+    def shortest_paths(self, destination):
+        """Distances and next hops towards destination (Dijkstra on reversed roads)."""
+        distances = {destination: 0}
+        next_hops = {}
+        queue = [(0, destination)]
+        while queue:
+            distance, b = heapq.heappop(queue)
+            if distance > distances[b]:
+                continue
+            for a, weight in self.incoming.get(b, {}).iteritems():
+                if distance + weight < distances.get(a, float('inf')):
+                    distances[a] = distance + weight
+                    next_hops[a] = b
+                    heapq.heappush(queue, (distance + weight, a))
+        return distances, next_hops
+
+    def next_hop(self, location, destination):
+        """Next intersection from location towards destination (None if there or unreachable)."""
+        return self.row(destination)[1].get(location)
+
+    def distance(self, location, destination):
+        return self.row(destination)[0].get(location, float('inf'))
+
+
+class RoutePlanner(planner.RoutePlanner):
+    """Route planner that follows shortest paths over the environment's roads."""
+
+    def __init__(self, env, agent):
+        super(RoutePlanner, self).__init__(env, agent, use_table=False)
+        self.engine = RouteEngine.of(env)
+
+    def compute_plan(self, location, heading, destination):
+        hop = self.engine.next_hop(location, destination)
+        if hop is None:
+            return None
+        return turns[(heading, (hop[0] - location[0], hop[1] - location[1]))]
@@ -1,6 +1,6 @@
 from environment import Environment
-from simulator import Simulator
-import pandas as pd
+from simulator import HeadlessSimulator
+import experiment
 from perfect_planner import RoutePlanner
 
 def run_sim(n_trials, agent):
@@ -14,22 +14,15 @@ def run_sim(n_trials, agent):
     # NOTE: You can set enforce_deadline=False while debugging to allow longer trials
 
     # Now simulate it
-    sim = Simulator(e, update_delay=0, display=False)  # create simulator (uses pygame when display=True, if available)
-    # NOTE: To speed up simulation, reduce update_delay and/or set display=False
+    sim = HeadlessSimulator(e)  # create simulator (no display, pacing or console output)
 
     return sim.run(n_trials=100)  # run for a specified number of trials
-    # NOTE: To quit midway, press Esc or close pygame window, or hit Ctrl+C on the command-line
 
-def run_sims(n_sims, n_trials, agent):
+def run_sims(n_sims, n_trials, agent, seed=None, processes=None, cache=None):
     """
-    Run n_sims with n_trials each with the agent.
+    Run n_sims with n_trials each with the agent and the perfect
+    planner, in parallel (see experiment.run_sims).
     Returns the results as a dataframe.
     """
-    results = []
-    for i in range(n_sims):
-        sim_results = run_sim(n_trials, agent)
-        results.append(sim_results)
-    df_results = pd.DataFrame(results)
-    df_results.columns = ['n_dest_reached', 'last_dest_fail', 'sum_time_left', 
-                          'n_penalties', 'last_penalty', 'len_qvals']
-    return df_results
\ No newline at end of file
+    return experiment.run_sims(agent, n_sims, n_trials, planner=RoutePlanner,
+                               seed=seed, processes=processes, cache=cache)
\ No newline at end of file
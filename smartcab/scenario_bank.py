@@ -0,0 +1,78 @@
+import numpy as np
+
+from environment import Environment, TrafficLight
+
+min_distance = 4  # start and destination are at least this far apart (see Environment.reset)
+
+
+def record_dtype(grid_size, num_dummies):
+    """
+    One trial: primary agent start, heading (index into
+    Environment.valid_headings), destination and deadline, the location and
+    heading of every dummy, and the initial state and period of every
+    traffic light (indexed by intersection coordinates minus one).
+    """
+    return np.dtype([('start', np.int16, 2),
+                     ('heading', np.int8),
+                     ('destination', np.int16, 2),
+                     ('deadline', np.int16),
+                     ('dummy_location', np.int16, (num_dummies, 2)),
+                     ('dummy_heading', np.int8, (num_dummies,)),
+                     ('light_state', np.bool_, tuple(grid_size)),
+                     ('light_period', np.int8, tuple(grid_size))])
+
+
+def generate(path, n, grid_size=(8, 6), num_dummies=3, seed=None):
+    """
+    Draw n trial scenarios as Environment.reset would and save them to
+    path (a .npy file). Returns the bank.
+    """
+    rng = np.random.RandomState(seed)
+    cols, rows = grid_size
+    records = np.zeros(n, dtype=record_dtype(grid_size, num_dummies))
+
+    def intersections(*shape):
+        return 1 + np.stack([rng.randint(cols, size=shape), rng.randint(rows, size=shape)], axis=-1)
+
+    # redraw start and destination together until they are far enough apart
+    start, destination = intersections(n), intersections(n)
+    distance = np.abs(destination - start).sum(axis=1)
+    close = np.flatnonzero(distance < min_distance)
+    while len(close):
+        start[close], destination[close] = intersections(len(close)), intersections(len(close))
+        distance[close] = np.abs(destination[close] - start[close]).sum(axis=1)
+        close = close[distance[close] < min_distance]
+
+    records['start'] = start
+    records['heading'] = rng.randint(len(Environment.valid_headings), size=n)
+    records['destination'] = destination
+    records['deadline'] = distance * 5
+    records['dummy_location'] = intersections(n, num_dummies)
+    records['dummy_heading'] = rng.randint(len(Environment.valid_headings), size=(n, num_dummies))
+    records['light_state'] = rng.randint(2, size=(n, cols, rows))
+    records['light_period'] = rng.choice(TrafficLight.valid_periods, size=(n, cols, rows))
+
+    np.save(path, records)
+    return ScenarioBank(path)
+
+
+class ScenarioBank(object):
+    """
+    Trial scenarios pre-generated with generate() and read from disk
+    through a memory map, so only the records in use are loaded.
+
+    Replaying one bank with different agents (see Environment.use_scenarios)
+    gives every agent exactly the same trials.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.records = np.load(path, mmap_mode='r')
+        self.grid_size = self.records.dtype['light_state'].shape
+        self.num_dummies = self.records.dtype['dummy_heading'].shape[0]
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, i):
+        return self.records[i]
@@ -1,5 +1,6 @@
 import pandas as pd
 import random
+import itertools
 from basic_agent import BasicAgent
 from environment import Environment
 from simulator import Simulator
@@ -7,43 +8,60 @@ from simulator import Simulator
 class LearningAgent(BasicAgent):
     """An agent that learns to drive in the smartcab world."""
 
+    def __init__(self, env):
+        super(LearningAgent, self).__init__(env)
+        self.known_states = set() # states with at least one q-value
+        # maps a state to the known states that differ from it
+        # in 1, 2, ..., len(state) - 1 items
+        self.similar_states = {}
+
     def best_action(self, state):
         """
         Returns the best action (the one with the maximum Q-value)
         or one of the best actions, given a state.
+        If the state is unknown, a similar known state is used.
         """
-        # get all possible q-values for the state
-        known_states = [key[0] for key in self.qvals.keys()]
-        if state in known_states:
-            all_qvals = {action: self.qvals.get((state, action), 0)
-                         for action in self.possible_actions}
-        else:
-            similar_state = self.get_similar_state(state)
-            all_qvals = {action: self.qvals.get((similar_state, action), 0)
-                         for action in self.possible_actions}
-        
-        # pick the actions that yield the largest q-value for the state
-        best_actions = [action for action in self.possible_actions 
-                        if all_qvals[action] == max(all_qvals.values())]
-        
-        # return one of the best actions at random
-        return random.choice(best_actions)
+        if state not in self.known_states:
+            state = self.get_similar_state(state)
+        return self.qvals.best_action(state)
 
     def get_similar_state(self, state):
+        """
+        Returns one of the known states closest to state
+        (by number of different items), or state itself
+        if no known state is close enough.
+        """
+        for similar_states in self.similar_states.get(state, []):
+            if similar_states:
+                return random.choice(similar_states)
+        return state
 
-        similar_state = []
-        dif = 1
-        
-        while (similar_state == []) and dif < len(state):
-            similar_states =  [sim_state for sim_state in self.qvals.keys()
-                               if sum(map(lambda a, b: a==b, 
-                                          state, sim_state)) >= len(state) - dif]
-            dif += 1
-            
-        if not similar_states:
-            similar_states = [state]
-        
-        return random.choice(similar_states)
+    def add_known_state(self, state):
+        """
+        Registers state as known with every state it is similar to.
+        The number of such states only depends on the state space,
+        not on how many states are known.
+        """
+        self.known_states.add(state)
+        for dif in range(1, len(state)):
+            for similar_state in self.neighbours(state, dif):
+                if similar_state not in self.similar_states:
+                    self.similar_states[similar_state] = [[] for i in range(1, len(state))]
+                self.similar_states[similar_state][dif - 1].append(state)
+
+    def neighbours(self, state, dif):
+        """
+        Yields every state that differs from state in exactly dif items.
+        """
+        state_values = self.qvals.state_values
+        for positions in itertools.combinations(range(len(state)), dif):
+            others = [[value for value in state_values[i] if value != state[i]]
+                      for i in positions]
+            for values in itertools.product(*others):
+                neighbour = list(state)
+                for i, value in zip(positions, values):
+                    neighbour[i] = value
+                yield tuple(neighbour)
 
     def update_qvals(self, state, action, reward):
         """
@@ -52,9 +70,9 @@ class LearningAgent(BasicAgent):
         # define the learning rate for the current time
         learn_rate = 1.0 / self.time
         
-        self.qvals[(self.state, action)] = \
-            (1 - learn_rate) * self.qvals.get((self.state, action), 0) + \
-            learn_rate * reward
+        if self.state not in self.known_states:
+            self.add_known_state(self.state)
+        self.qvals.learn(self.state, action, reward, learn_rate)
 
 def run():
     """Run the agent for a finite number of trials."""
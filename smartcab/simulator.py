@@ -25,8 +25,9 @@ class Simulator(object):
         'orange'  : (255, 128,   0)
     }
 
-    def __init__(self, env, size=None, update_delay=1.0, display=True, live_plot=False):
+    def __init__(self, env, size=None, update_delay=1.0, display=True, live_plot=False, log=None):
         self.env = env
+        self.log = log  # trajectory_log.TrajectoryLog of the primary agent's steps, if any
         self.size = size if size is not None else ((self.env.grid_size[0] + 1) * self.env.block_size, (self.env.grid_size[1] + 1) * self.env.block_size)
         self.width, self.height = self.size
         
@@ -50,11 +51,16 @@ class Simulator(object):
                 self.frame_delay = max(1, int(self.update_delay * 1000))  # delay between GUI frames in ms (min: 1)
                 self.agent_sprite_size = (32, 32)
                 self.agent_circle_radius = 10  # radius of circle, when using simple representation
+                self.sprites = {}  # (color, heading) -> sprite, rotated to face heading
                 for agent in self.env.agent_states:
-                    agent._sprite = self.pygame.transform.smoothscale(self.pygame.image.load(os.path.join("images", "car-{}.png".format(agent.color))), self.agent_sprite_size)
+                    if (agent.color, (1, 0)) not in self.sprites:
+                        self.sprites[(agent.color, (1, 0))] = self.pygame.transform.smoothscale(self.pygame.image.load(os.path.join("images", "car-{}.png".format(agent.color))), self.agent_sprite_size)
+                    agent._sprite = self.sprites[(agent.color, (1, 0))]
                     agent._sprite_size = (agent._sprite.get_width(), agent._sprite.get_height())
 
                 self.font = self.pygame.font.Font(None, 28)
+                self.labels = {}  # (text, color) -> rendered text
+                self.background = None  # road network and traffic lights, built by the first render
                 self.paused = False
             except ImportError as e:
                 self.display = False
@@ -65,8 +71,9 @@ class Simulator(object):
 
         # Setup metrics to report
         self.live_plot = live_plot
-        self.rep = Reporter(metrics=['net_reward', 'avg_net_reward', 'final_deadline', 'success'], live_plot=self.live_plot)
         self.avg_net_reward_window = 10
+        self.rep = Reporter(metrics=['net_reward', 'avg_net_reward', 'final_deadline', 'success'], live_plot=self.live_plot,
+                            windows={'net_reward': self.avg_net_reward_window})
 
     def run(self, n_trials=1):
         self.quit = False
@@ -101,7 +108,8 @@ class Simulator(object):
                     # Update environment
                     if self.current_time - self.last_updated >= self.update_delay:
                         self.env.step()
-                        # TODO: Log step data
+                        if self.log is not None:
+                            self.log.record(trial, self.env.step_data)
                         self.last_updated = self.current_time
 
                     # Render GUI and sleep
@@ -112,11 +120,7 @@ class Simulator(object):
                     self.quit = True
                 finally:
                     if self.quit or self.env.done:
-                        state = self.env.agent_states[self.env.primary_agent]                        
-                        if state['location'] != state['destination']:
-                            self.env.primary_agent.last_dest_fail = trial + 1
-                        if self.env.primary_agent.n_penalties > prev_penalty:
-                            self.env.primary_agent.last_penalty = trial + 1
+                        self.end_trial(trial, prev_penalty)
                         break
             
             p_agent = self.env.primary_agent
@@ -124,10 +128,7 @@ class Simulator(object):
                 break
         
             # Collect/update metrics
-            self.rep.collect('net_reward', trial, self.env.trial_data['net_reward'])  # total reward obtained in this trial
-            self.rep.collect('avg_net_reward', trial, np.mean(self.rep.metrics['net_reward'].ydata[-self.avg_net_reward_window:]))  # rolling mean of reward
-            self.rep.collect('final_deadline', trial, self.env.trial_data['final_deadline'])  # final deadline value (time remaining)
-            self.rep.collect('success', trial, self.env.trial_data['success'])
+            self.collect_metrics(trial)
             if self.live_plot:
                 self.rep.refresh_plot()  # autoscales axes, draws stuff and flushes events
 
@@ -136,63 +137,153 @@ class Simulator(object):
             self.pygame.display.quit()  # need to shutdown pygame before showing metrics plot
             # TODO: Figure out why having both game and plot displays makes things crash!
 
+        if self.log is not None:
+            self.log.flush()
+
         if self.live_plot:
             self.rep.show_plot()  # holds till user closes plot window
         
+        return self.results(p_agent)
+
+    def end_trial(self, trial, prev_penalty):
+        """Record destination failures and penalties of the trial that just ended."""
+        p_agent = self.env.primary_agent
+        state = self.env.agent_states[p_agent]
+        if state['location'] != state['destination']:
+            p_agent.last_dest_fail = trial + 1
+        if p_agent.n_penalties > prev_penalty:
+            p_agent.last_penalty = trial + 1
+
+    def collect_metrics(self, trial):
+        self.rep.collect('net_reward', trial, self.env.trial_data['net_reward'])  # total reward obtained in this trial
+        self.rep.collect('avg_net_reward', trial, self.rep.metrics['net_reward'].window_mean())  # rolling mean of reward
+        self.rep.collect('final_deadline', trial, self.env.trial_data['final_deadline'])  # final deadline value (time remaining)
+        self.rep.collect('success', trial, self.env.trial_data['success'])
+
+    def results(self, p_agent):
         return (p_agent.n_dest_reached, p_agent.last_dest_fail, 
                 p_agent.sum_time_left, p_agent.n_penalties,
                 p_agent.last_penalty, len(p_agent.qvals))
 
-    def render(self):
-        # Clear screen
-        self.screen.fill(self.bg_color)
+    def frame(self):
+        """
+        What render draws, as of now: the light time, each agent with its
+        location, heading, destination and next waypoint, the locations and
+        headings of the dummy traffic (if any) and the status text.
+        """
+        agents = [(agent, state['location'], state['heading'], state['destination'], agent.get_next_waypoint())
+                  for agent, state in self.env.agent_states.iteritems()]
+        traffic = self.env.traffic
+        if traffic is not None:
+            traffic = traffic.location.tolist(), traffic.headings[traffic.heading].tolist()
+        return self.env.light_t, agents, traffic, self.env.status_text
 
-        # Draw elements
-        # * Static elements
-        for road in self.env.roads:
-            self.pygame.draw.line(self.screen, self.road_color, (road[0][0] * self.env.block_size, road[0][1] * self.env.block_size), (road[1][0] * self.env.block_size, road[1][1] * self.env.block_size), self.road_width)
+    def render(self, frame=None):
+        """Draw a frame (by default the current one, see frame())."""
+        light_t, agents, traffic, status_text = frame if frame is not None else self.frame()
+        if self.background is None:
+            self.draw_background()
 
+        # Restore the background wherever the previous frame drew
+        for rect in self.dirty:
+            self.screen.blit(self.background, rect, rect)
+        updated = self.dirty
+        self.dirty = []
+
+        # Draw elements
+        # * Traffic lights (on the background, only when they switch)
         for intersection, traffic_light in self.env.intersections.iteritems():
-            self.pygame.draw.circle(self.screen, self.road_color, (intersection[0] * self.env.block_size, intersection[1] * self.env.block_size), 10)
-            if traffic_light.state:  # North-South is open
-                self.pygame.draw.line(self.screen, self.colors['green'],
-                    (intersection[0] * self.env.block_size, intersection[1] * self.env.block_size - 15),
-                    (intersection[0] * self.env.block_size, intersection[1] * self.env.block_size + 15), self.road_width)
-            else:  # East-West is open
-                self.pygame.draw.line(self.screen, self.colors['green'],
-                    (intersection[0] * self.env.block_size - 15, intersection[1] * self.env.block_size),
-                    (intersection[0] * self.env.block_size + 15, intersection[1] * self.env.block_size), self.road_width)
+            state = traffic_light.state_at(light_t)
+            if self.light_states.get(intersection) != state:
+                self.light_states[intersection] = state
+                updated.append(self.draw_light(intersection, state))
 
         # * Dynamic elements
-        for agent, state in self.env.agent_states.iteritems():
+        for agent, location, heading, destination, waypoint in agents:
             # Compute precise agent location here (back from the intersection some)
-            agent_offset = (2 * state['heading'][0] * self.agent_circle_radius, 2 * state['heading'][1] * self.agent_circle_radius)
-            agent_pos = (state['location'][0] * self.env.block_size - agent_offset[0], state['location'][1] * self.env.block_size - agent_offset[1])
+            agent_offset = (2 * heading[0] * self.agent_circle_radius, 2 * heading[1] * self.agent_circle_radius)
+            agent_pos = (location[0] * self.env.block_size - agent_offset[0], location[1] * self.env.block_size - agent_offset[1])
             agent_color = self.colors[agent.color]
             if hasattr(agent, '_sprite') and agent._sprite is not None:
                 # Draw agent sprite (image), properly rotated
-                rotated_sprite = agent._sprite if state['heading'] == (1, 0) else self.pygame.transform.rotate(agent._sprite, 180 if state['heading'][0] == -1 else state['heading'][1] * -90)
-                self.screen.blit(rotated_sprite,
+                self.dirty.append(self.screen.blit(self.sprite(agent, heading),
                     self.pygame.rect.Rect(agent_pos[0] - agent._sprite_size[0] / 2, agent_pos[1] - agent._sprite_size[1] / 2,
-                        agent._sprite_size[0], agent._sprite_size[1]))
+                        agent._sprite_size[0], agent._sprite_size[1])))
             else:
                 # Draw simple agent (circle with a short line segment poking out to indicate heading)
-                self.pygame.draw.circle(self.screen, agent_color, agent_pos, self.agent_circle_radius)
-                self.pygame.draw.line(self.screen, agent_color, agent_pos, state['location'], self.road_width)
-            if agent.get_next_waypoint() is not None:
-                self.screen.blit(self.font.render(agent.get_next_waypoint(), True, agent_color, self.bg_color), (agent_pos[0] + 10, agent_pos[1] + 10))
-            if state['destination'] is not None:
-                self.pygame.draw.circle(self.screen, agent_color, (state['destination'][0] * self.env.block_size, state['destination'][1] * self.env.block_size), 6)
-                self.pygame.draw.circle(self.screen, agent_color, (state['destination'][0] * self.env.block_size, state['destination'][1] * self.env.block_size), 15, 2)
+                self.dirty.append(self.pygame.draw.circle(self.screen, agent_color, agent_pos, self.agent_circle_radius))
+                self.dirty.append(self.pygame.draw.line(self.screen, agent_color, agent_pos, location, self.road_width).inflate(self.road_width, self.road_width))  # thick line rects can fall short
+            if waypoint is not None:
+                self.dirty.append(self.screen.blit(self.label(waypoint, agent_color), (agent_pos[0] + 10, agent_pos[1] + 10)))
+            if destination is not None:
+                self.dirty.append(self.pygame.draw.circle(self.screen, agent_color, (destination[0] * self.env.block_size, destination[1] * self.env.block_size), 6))
+                self.dirty.append(self.pygame.draw.circle(self.screen, agent_color, (destination[0] * self.env.block_size, destination[1] * self.env.block_size), 15, 2))
+
+        if traffic is not None:
+            # Draw dummy traffic as simple agents (circle with a short line segment poking out to indicate heading)
+            for location, heading in zip(*traffic):
+                agent_pos = (location[0] * self.env.block_size - 2 * heading[0] * self.agent_circle_radius, location[1] * self.env.block_size - 2 * heading[1] * self.agent_circle_radius)
+                agent_end = (agent_pos[0] + heading[0] * self.agent_circle_radius, agent_pos[1] + heading[1] * self.agent_circle_radius)
+                self.dirty.append(self.pygame.draw.circle(self.screen, self.colors['blue'], agent_pos, self.agent_circle_radius))
+                self.dirty.append(self.pygame.draw.line(self.screen, self.colors['blue'], agent_pos, agent_end, self.road_width).inflate(self.road_width, self.road_width))
 
         # * Overlays
         text_y = 10
-        for text in self.env.status_text.split('\n'):
-            self.screen.blit(self.font.render(text, True, self.colors['red'], self.bg_color), (100, text_y))
+        for text in status_text.split('\n'):
+            self.dirty.append(self.screen.blit(self.label(text, self.colors['red']), (100, text_y)))
             text_y += 20
 
-        # Flip buffers
-        self.pygame.display.flip()
+        # Flip buffers (only the parts that changed, unless everything did)
+        if self.full_redraw:
+            self.pygame.display.flip()
+            self.full_redraw = False
+        else:
+            self.pygame.display.update(updated + self.dirty)
+
+    def draw_background(self):
+        """Draw the static road network once, and start a full redraw on top of it."""
+        self.static = self.screen.copy()  # same pixel format as the screen
+        self.static.fill(self.bg_color)
+        for road in self.env.roads:
+            self.pygame.draw.line(self.static, self.road_color, (road[0][0] * self.env.block_size, road[0][1] * self.env.block_size), (road[1][0] * self.env.block_size, road[1][1] * self.env.block_size), self.road_width)
+        for intersection in self.env.intersections:
+            self.pygame.draw.circle(self.static, self.road_color, (intersection[0] * self.env.block_size, intersection[1] * self.env.block_size), 10)
+        self.background = self.static.copy()  # static layer plus traffic lights
+        self.light_states = {}
+        self.dirty = []  # rects drawn over the background in the last frame
+        self.redraw()
+
+    def redraw(self):
+        """Repaint the whole screen on the next render."""
+        self.screen.blit(self.background, (0, 0))
+        self.dirty = []
+        self.full_redraw = True
+
+    def draw_light(self, intersection, state):
+        """Draw a traffic light on the background; return the rect it covers."""
+        x, y = intersection[0] * self.env.block_size, intersection[1] * self.env.block_size
+        rect = self.pygame.rect.Rect(x - 15 - self.road_width, y - 15 - self.road_width, 30 + 2 * self.road_width, 30 + 2 * self.road_width)
+        self.background.blit(self.static, rect, rect)
+        if state:  # North-South is open
+            self.pygame.draw.line(self.background, self.colors['green'], (x, y - 15), (x, y + 15), self.road_width)
+        else:  # East-West is open
+            self.pygame.draw.line(self.background, self.colors['green'], (x - 15, y), (x + 15, y), self.road_width)
+        self.screen.blit(self.background, rect, rect)
+        return rect
+
+    def sprite(self, agent, heading):
+        """Agent sprite rotated to face heading (rotations are cached per color)."""
+        key = (agent.color, heading)
+        if key not in self.sprites:
+            self.sprites[key] = self.pygame.transform.rotate(agent._sprite, 180 if heading[0] == -1 else heading[1] * -90)
+        return self.sprites[key]
+
+    def label(self, text, color):
+        """Rendered text, cached per (text, color)."""
+        key = (text, color)
+        if key not in self.labels:
+            self.labels[key] = self.font.render(text, True, color, self.bg_color)
+        return self.labels[key]
 
     def pause(self):
         abs_pause_time = time.time()
@@ -205,5 +296,123 @@ class Simulator(object):
                 if event.type == self.pygame.KEYDOWN:
                     self.paused = False
             self.pygame.time.wait(self.frame_delay)
-        self.screen.blit(self.font.render(pause_text, True, self.bg_color, self.bg_color), (100, self.height - 40))
+        if self.background is not None:
+            self.redraw()  # clears the pause text
         self.start_time += (time.time() - abs_pause_time)
+
+
+
+class HeadlessSimulator(Simulator):
+    """Simulates agents without display, clock or console output.
+
+    Trials advance purely on step count, as fast as possible; run() returns
+    the same results as Simulator.run().
+    """
+
+    def __init__(self, env, log=None):
+        super(HeadlessSimulator, self).__init__(env, update_delay=0, display=False, live_plot=False, log=log)
+
+    def run(self, n_trials=1):
+        self.quit = False
+        self.rep.reset()
+        verbose, self.env.verbose = self.env.verbose, False  # the environment may be shared with other simulators
+        try:
+            for trial in xrange(n_trials):
+                self.run_trial(trial, n_trials)
+                self.collect_metrics(trial)
+        finally:
+            self.env.verbose = verbose
+        if self.log is not None:
+            self.log.flush()
+
+        return self.results(self.env.primary_agent)
+
+    def run_trial(self, trial, n_trials):
+        p_agent = self.env.primary_agent
+        self.env.reset()
+        prev_penalty = p_agent.n_penalties
+        while not self.env.done:
+            self.env.step()
+            if self.log is not None:
+                self.log.record(trial, self.env.step_data)
+        self.end_trial(trial, prev_penalty)
+
+
+def first_last_or_penalized(trial, n_trials, penalized):
+    """
+    Default selection of RecordingSimulator: the first and last trials, and
+    any trial with a penalty (so no trial can be ruled out before it runs).
+    """
+    return trial == 0 or trial == n_trials - 1 or penalized
+
+
+class RecordingSimulator(HeadlessSimulator):
+    """
+    Simulates agents headless, saving frames of selected trials as PNG
+    images rendered offscreen (SDL dummy video driver).
+
+    Trials run at full headless speed. Before a trial starts,
+    select(trial, n_trials, None) is asked whether it could be kept at all
+    (penalized is not known yet); a trial for which it returns False runs
+    exactly as in HeadlessSimulator. Any other trial keeps a snapshot (see
+    Simulator.frame) of every frame_every-th step and of the last one,
+    which slows trials down by about 5% with DummyTraffic and up to about
+    25% with many DummyAgents (one tuple per agent). Once such a trial ends,
+    select(trial, n_trials, penalized) decides whether to keep it; the
+    snapshots of a kept trial are rendered to
+    folder/trial<trial>/step<step>.png, before the next trial resets the
+    traffic lights. Nothing is run again, so recording has no side effects
+    on the agents.
+
+    The default selection can rule out no trial in advance (any trial may
+    be penalized), so every trial pays for its snapshots.
+
+    SDL picks the dummy video driver when the display is initialised; the
+    previous SDL_VIDEODRIVER is restored right after, but the pygame display
+    stays offscreen until pygame.display.quit() is called.
+    """
+
+    def __init__(self, env, folder, frame_every=1, select=first_last_or_penalized, log=None):
+        driver = os.environ.get('SDL_VIDEODRIVER')
+        os.environ['SDL_VIDEODRIVER'] = 'dummy'  # render offscreen
+        try:
+            Simulator.__init__(self, env, update_delay=0, display=True, live_plot=False, log=log)
+        finally:
+            # only read when the display is initialised; don't leave it set for other simulators
+            if driver is None:
+                del os.environ['SDL_VIDEODRIVER']
+            else:
+                os.environ['SDL_VIDEODRIVER'] = driver
+        if not self.display:
+            raise RuntimeError("RecordingSimulator.__init__(): Unable to set up offscreen rendering (needs pygame and car images)")
+        self.folder = folder
+        self.frame_every = frame_every
+        self.select = select
+        self.n_frames = 0
+
+    def run_trial(self, trial, n_trials):
+        if self.select(trial, n_trials, None) is False:
+            return super(RecordingSimulator, self).run_trial(trial, n_trials)  # cannot be kept: no snapshots
+        p_agent = self.env.primary_agent
+        self.env.reset()
+        prev_penalty = p_agent.n_penalties
+        frames = [(0, self.frame())]
+        while not self.env.done:
+            self.env.step()
+            if self.log is not None:
+                self.log.record(trial, self.env.step_data)
+            if self.env.t % self.frame_every == 0 or self.env.done:
+                frames.append((self.env.t, self.frame()))
+        self.end_trial(trial, prev_penalty)
+        if self.select(trial, n_trials, p_agent.n_penalties > prev_penalty):
+            self.record(trial, frames)
+
+    def record(self, trial, frames):
+        """Save the (step, frame) snapshots of a trial."""
+        folder = os.path.join(self.folder, 'trial{:05d}'.format(trial))
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        for step, frame in frames:
+            self.render(frame)
+            self.pygame.image.save(self.screen, os.path.join(folder, 'step{:04d}.png'.format(step)))
+            self.n_frames += 1
@@ -0,0 +1,99 @@
+import os
+import json
+
+import numpy as np
+import pandas as pd
+
+from environment import Environment
+
+# one row per step of the primary agent; actions, waypoints and sensed
+# traffic are indices into Environment.valid_actions, light is 1 for green,
+# heading an index into Environment.valid_headings, (x, y) the location
+# where the action was taken
+row_dtype = np.dtype([('trial', np.int32), ('t', np.int32), ('deadline', np.int16),
+                      ('waypoint', np.int8), ('light', np.int8), ('oncoming', np.int8),
+                      ('left', np.int8), ('right', np.int8), ('action', np.int8),
+                      ('reward', np.float32), ('x', np.int16), ('y', np.int16),
+                      ('heading', np.int8)])
+
+action_codes = {action: i for i, action in enumerate(Environment.valid_actions)}
+heading_codes = {heading: i for i, heading in enumerate(Environment.valid_headings)}
+
+
+class TrajectoryLog(object):
+    """
+    Step-by-step log of the primary agent, written as one binary file per
+    column (<folder>/<column>.bin, raw values in row_dtype's types).
+
+    Rows are buffered in a preallocated array and appended to the column
+    files chunk_size rows at a time (and on flush), so logging a step is a
+    single row assignment. Use read() to load a log back.
+    """
+
+    def __init__(self, folder, chunk_size=2 ** 16):
+        self.folder = folder
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        self.buffer = np.zeros(chunk_size, dtype=row_dtype)
+        self.n = 0  # rows in the buffer
+        self.n_rows = 0  # rows written so far
+        with open(os.path.join(folder, 'columns.json'), 'w') as f:
+            json.dump([(name, row_dtype[name].str) for name in row_dtype.names], f)
+        for name in row_dtype.names:
+            open(self.path(name), 'wb').close()
+
+    def path(self, name):
+        return os.path.join(self.folder, name + '.bin')
+
+    def record(self, trial, step_data):
+        """Log the last step of the primary agent (see Environment.step_data)."""
+        inputs = step_data['inputs']
+        location = step_data['location']
+        self.buffer[self.n] = (trial, step_data['t'], step_data['deadline'],
+                               action_codes[step_data['waypoint']], inputs['light'] == 'green',
+                               action_codes[inputs['oncoming']], action_codes[inputs['left']],
+                               action_codes[inputs['right']], action_codes[step_data['action']],
+                               step_data['reward'], location[0], location[1],
+                               heading_codes[step_data['heading']])
+        self.n += 1
+        if self.n == len(self.buffer):
+            self.flush()
+
+    def flush(self):
+        """Append the buffered rows to the column files."""
+        for name in row_dtype.names:
+            with open(self.path(name), 'ab') as f:
+                self.buffer[name][:self.n].tofile(f)
+        self.n_rows += self.n
+        self.n = 0
+
+
+def read_columns(folder):
+    """The columns of a trajectory log, as memory-mapped arrays."""
+    with open(os.path.join(folder, 'columns.json')) as f:
+        columns = json.load(f)
+    result = {}
+    for name, dtype in columns:
+        path = os.path.join(folder, name + '.bin')
+        # np.memmap cannot map an empty file
+        result[name] = np.memmap(path, dtype=dtype, mode='r') if os.path.getsize(path) else np.zeros(0, dtype=dtype)
+    return result
+
+
+def read(folder, decode=False):
+    """
+    A trajectory log as a dataframe, one row per step. With decode,
+    codes are turned back into actions, lights and headings.
+    """
+    columns = read_columns(folder)
+    df = pd.DataFrame({name: columns[name] for name in row_dtype.names}, columns=row_dtype.names)
+    if decode:
+        actions = np.array(Environment.valid_actions, dtype=object)
+        for name in ('waypoint', 'oncoming', 'left', 'right', 'action'):
+            df[name] = actions[df[name].values]
+        df['light'] = np.where(df['light'].values, 'green', 'red')
+        headings = np.empty(len(Environment.valid_headings), dtype=object)
+        for i, heading in enumerate(Environment.valid_headings):
+            headings[i] = heading  # (an array of tuples would become 2-D)
+        df['heading'] = headings[df['heading'].values]
+    return df